@@ -19,7 +19,6 @@ Architecture:
   ui/tab_add_product.py → Tab 4: add custom products
   ui/components.py    → shared UI helpers
 """
-import time
 import logging
 
 import streamlit as st
@@ -44,7 +43,8 @@ st.set_page_config(
 from styles import APP_CSS
 from cloudinary_client import init_cloudinary
 from database import load_cart_from_db, migrate_old_custom_items
-from data_loader import load_data_cached
+from cart import set_cart
+from data_loader import load_versioned_data
 
 # ── Inject CSS ────────────────────────────────────────────────────────────
 st.markdown(APP_CSS, unsafe_allow_html=True)
@@ -61,8 +61,6 @@ _defaults = {
     "selected_categories_multi":    [],
     "selected_subcategories_multi": [],
     "item_search_query":            "",
-    "master_pid_map":               {},
-    "data_timestamp":               time.time(),
 }
 for key, val in _defaults.items():
     if key not in st.session_state:
@@ -70,18 +68,13 @@ for key, val in _defaults.items():
 
 # Load persisted cart from JSON DB on first run only
 if st.session_state.cart is None:
-    st.session_state.cart = load_cart_from_db()
+    set_cart(load_cart_from_db())
 
 # ── One-time migration from legacy custom_products.json ──────────────────
 migrate_old_custom_items()
 
-# ── Load product data (cached; bust cache by updating data_timestamp) ─────
-products_df = load_data_cached(st.session_state.data_timestamp)
-
-# Rebuild fast ProductID → row lookup map
-st.session_state.master_pid_map = {
-    row["ProductID"]: row.to_dict() for _, row in products_df.iterrows()
-}
+# ── Load product data (cached per content-derived data version) ───────────
+st.session_state.data_version, products_df = load_versioned_data()
 
 # ── Sidebar ───────────────────────────────────────────────────────────────
 from ui.sidebar import render_sidebar
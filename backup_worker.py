@@ -0,0 +1,112 @@
+"""
+HEM Product Catalogue - Background Backup Worker
+Write-behind Cloudinary backups so UI interactions never wait on the network.
+
+Callers schedule a backup job by kind ("db", "templates"). Jobs of the same
+kind are coalesced: only the latest one is kept, and a daemon thread runs
+pending jobs at most once per BACKUP_INTERVAL_SEC. Each job reads the
+current persisted state when it runs, so a burst of edits costs a single
+upload. Failed jobs stay in the backlog and are retried on the next round.
+At interpreter shutdown the exit hook waits briefly for a job that is
+already running, re-runs it if it has not finished, and flushes whatever
+is still pending once.
+"""
+import time
+import atexit
+import logging
+import threading
+from datetime import datetime
+
+from config import BACKUP_INTERVAL_SEC
+
+logger = logging.getLogger(__name__)
+
+_cond = threading.Condition()
+_pending = {}        # kind → job callable returning True on success
+_running = {}        # kind → job currently executing (popped from _pending)
+_thread = None
+_last_run = 0.0
+EXIT_WAIT_SEC = 10.0
+_status = {
+    "last_success": None,
+    "last_error": None,
+}
+
+
+def schedule(kind, job):
+    """Queue a backup job, replacing any pending job of the same kind."""
+    global _thread
+    with _cond:
+        _pending[kind] = job
+        if _thread is None or not _thread.is_alive():
+            _thread = threading.Thread(
+                target=_run, name="cloudinary-backup", daemon=True
+            )
+            _thread.start()
+        _cond.notify()
+
+
+def _run():
+    global _last_run
+    while True:
+        with _cond:
+            while not _pending:
+                _cond.wait()
+            # Debounce: let the burst settle, never upload more than once
+            # per interval.
+            delay = _last_run + BACKUP_INTERVAL_SEC - time.time()
+            while delay > 0:
+                _cond.wait(delay)
+                delay = _last_run + BACKUP_INTERVAL_SEC - time.time()
+            _last_run = time.time()
+        flush()
+
+
+def flush():
+    """Run every pending job now (in the calling thread)."""
+    with _cond:
+        jobs = list(_pending.items())
+        _pending.clear()
+    for kind, job in jobs:
+        with _cond:
+            _running[kind] = job
+        try:
+            ok = job()
+        except Exception as e:
+            logger.error(f"Backup job '{kind}' failed: {e}")
+            ok = False
+        with _cond:
+            if _running.get(kind) is job:
+                del _running[kind]
+            _cond.notify_all()
+            if ok:
+                _status["last_success"] = datetime.now()
+            else:
+                _status["last_error"] = datetime.now()
+                # Keep it for a retry unless a newer job already replaced it
+                _pending.setdefault(kind, job)
+
+
+def backup_status():
+    """Return {"backlog": [...kinds], "last_success": dt|None, "last_error": dt|None}."""
+    with _cond:
+        return {"backlog": sorted(set(_pending) | set(_running)), **_status}
+
+
+def _flush_on_exit():
+    with _cond:
+        # The worker may be mid-upload; give it a moment, then re-run
+        # anything still in flight here rather than lose it with the
+        # daemon thread.
+        deadline = time.time() + EXIT_WAIT_SEC
+        while _running and time.time() < deadline:
+            _cond.wait(deadline - time.time())
+        for kind, job in _running.items():
+            _pending.setdefault(kind, job)
+        count = len(_pending)
+    if count:
+        logger.info(f"Flushing {count} pending backup(s) before exit")
+        flush()
+
+
+atexit.register(_flush_on_exit)
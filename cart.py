@@ -1,6 +1,13 @@
 """
 HEM Product Catalogue - Cart Module
 Shopping cart operations with duplicate detection.
+
+The cart (st.session_state.cart) is an ordered {ProductID: entry} dict.
+An entry holds only the ProductID plus per-item values (CART_ITEM_FIELDS);
+product fields are hydrated on demand from the shared catalogue, so adds
+and removes are O(1) and the persisted cart is a short list of references.
+Entries whose product is no longer in the catalogue keep a full copy of
+the item (legacy saved carts/templates) so they are never lost.
 """
 import logging
 
@@ -8,103 +15,203 @@ import pandas as pd
 import streamlit as st
 
 from config import CART_COLUMNS, NO_SELECTION_PLACEHOLDER
-from database import save_cart_to_db
+from database import save_cart_to_db, add_cart_items_to_db, remove_cart_items_from_db
+from data_loader import pid_index
 
 logger = logging.getLogger(__name__)
 
+# Per-item values stored with the ProductID (everything else is hydrated)
+CART_ITEM_FIELDS = ("SerialNo",)
+
+
+# =========================================================================
+# Cart State & Hydration
+# =========================================================================
+
+def _catalogue_rows():
+    """ProductID → catalogue row dict for the loaded data version."""
+    return pid_index(st.session_state.get('data_version'))
+
+
+def set_cart(items):
+    """Replace the cart with saved items (references or legacy full dicts)."""
+    previous = st.session_state.get("cart") or {}
+    st.session_state.cart = {
+        item["ProductID"]: dict(item)
+        for item in items or [] if item.get("ProductID")
+    }
+    _forget_selection(pid for pid in previous if pid not in st.session_state.cart)
+
+
+def cart_entries():
+    """Compact, persistable form of the cart: [{"ProductID", ...per-item}].
+    Items missing from the catalogue keep their stored copy."""
+    rows = _catalogue_rows()
+    return [
+        {"ProductID": pid, **{k: e[k] for k in CART_ITEM_FIELDS if k in e}}
+        if pid in rows else e
+        for pid, e in st.session_state.cart.items()
+    ]
+
+
+def cart_items():
+    """Cart as full item dicts (CART_COLUMNS), in cart order."""
+    rows = _catalogue_rows()
+    items = []
+    for pid, entry in st.session_state.cart.items():
+        row = rows.get(pid)
+        if row is not None:
+            item = {col: row.get(col, '') for col in CART_COLUMNS}
+            item.update((k, entry[k]) for k in CART_ITEM_FIELDS if k in entry)
+        elif "ItemName" in entry:
+            item = {col: entry.get(col, '') for col in CART_COLUMNS}
+        else:
+            continue
+        items.append(item)
+    return items
+
+
+def apply_item_edits(changes):
+    """Apply {pid: {field: value}} to self-contained cart entries (products
+    no longer in the catalogue); catalogue-backed items, custom products
+    included, pick up edits through hydration since the composed frame
+    carries every override."""
+    rows = _catalogue_rows()
+    touched = False
+    for pid, delta in changes.items():
+        entry = st.session_state.cart.get(pid)
+        if entry is not None and pid not in rows:
+            entry.update(delta)
+            touched = True
+    if touched:
+        save_cart_to_db(cart_entries())
+
+
+def _cart_changed():
+    """Drop generated exports; callers persist just the rows they changed."""
+    st.session_state.gen_pdf_bytes = None
+    st.session_state.gen_excel_bytes = None
+
+
+# =========================================================================
+# Cart Operations
+# =========================================================================
 
 def add_to_cart(selected_df):
     """Add products to cart from a DataFrame. Skips duplicates with a toast."""
-    current_pids = {item["ProductID"] for item in st.session_state.cart}
-    new_items = []
-    duplicate_count = 0
-
     if isinstance(selected_df, pd.Series):
         selected_df = pd.DataFrame([selected_df])
+    _add_pids(selected_df["ProductID"].tolist())
 
-    for _, row in selected_df.iterrows():
-        pid = row.get("ProductID")
-        if pid and pid not in current_pids:
-            new_items.append({col: row.get(col, '') for col in CART_COLUMNS})
-            current_pids.add(pid)  # Prevent duplicates within same batch
-        elif pid in current_pids:
+
+def _add_pids(pids, label="items"):
+    """Append ProductIDs to the cart, skipping ones already in it."""
+    cart = st.session_state.cart
+    new_entries = []
+    duplicate_count = 0
+    for pid in pids:
+        if not pid:
+            continue
+        if pid in cart:
             duplicate_count += 1
+        else:
+            cart[pid] = {"ProductID": pid}
+            new_entries.append(cart[pid])
+    added = len(new_entries)
 
-    if new_items:
-        st.session_state.cart.extend(new_items)
-        st.session_state.gen_pdf_bytes = None
-        st.session_state.gen_excel_bytes = None
-        save_cart_to_db(st.session_state.cart)
-        st.toast(f"Added {len(new_items)} items to cart!", icon="\U0001f6d2")
+    if added:
+        _cart_changed()
+        add_cart_items_to_db(new_entries)
+        st.toast(f"Added {added} {label} to cart!", icon="\U0001f6d2")
 
     if duplicate_count > 0:
         st.toast(
             f"{duplicate_count} item(s) already in cart, skipped.",
             icon="\u2139\ufe0f",
         )
+    return added, duplicate_count
 
 
 def remove_from_cart(pids_to_remove):
-    """Remove products from cart by ProductID set."""
-    if pids_to_remove:
-        pids_set = set(pids_to_remove) if not isinstance(pids_to_remove, set) else pids_to_remove
-        st.session_state.cart = [
-            i for i in st.session_state.cart
-            if i.get("ProductID") not in pids_set
-        ]
-    st.session_state.gen_pdf_bytes = None
-    st.session_state.gen_excel_bytes = None
-    save_cart_to_db(st.session_state.cart)
+    """Remove products from cart by ProductID."""
+    removed = [
+        pid for pid in pids_to_remove or ()
+        if st.session_state.cart.pop(pid, None) is not None
+    ]
+    if removed:
+        _cart_changed()
+        _forget_selection(removed)
+        remove_cart_items_from_db(removed)
 
 
 def clear_cart():
     """Remove all items from cart."""
-    st.session_state.cart = []
-    st.session_state.gen_pdf_bytes = None
-    st.session_state.gen_excel_bytes = None
+    removed = list(st.session_state.cart)
+    st.session_state.cart = {}
+    _cart_changed()
+    _forget_selection(removed)
     save_cart_to_db([])
 
 
-def add_selected_visible_to_cart(df_visible):
-    """Add only the checkbox-selected products that are currently visible."""
-    pid_map = st.session_state.get('master_pid_map', {})
-    visible_pids = set(df_visible['ProductID'].tolist())
-    current_cart_pids = {
-        item["ProductID"] for item in st.session_state.cart if "ProductID" in item
-    }
+# =========================================================================
+# Checkbox Selection
+# =========================================================================
+# Product checkboxes update an explicit selection set through their
+# on_change callback, so "add selected" never scans st.session_state.
+# A checkbox renders ticked while its product is in the cart or in the
+# set, so it stays in step after Streamlit drops the state of a checkbox
+# that was not rendered (page, filter or search change).
+
+def selection_key(pid):
+    return f"checkbox_{pid}"
+
+
+def selected_pids():
+    """The set of ProductIDs ticked in the product list (not yet added)."""
+    if "selected_pids" not in st.session_state:
+        st.session_state.selected_pids = set()
+    return st.session_state.selected_pids
 
-    new_items = []
-    duplicate_count = 0
 
-    for key, is_checked in st.session_state.items():
-        if key.startswith("checkbox_") and is_checked:
-            pid = key.replace("checkbox_", "")
-            if pid not in visible_pids:
-                continue
-            if pid in current_cart_pids:
-                duplicate_count += 1
-                continue
-            product_data = pid_map.get(pid)
-            if product_data:
-                row_series = pd.Series(product_data)
-                new_items.append(
-                    {col: row_series.get(col, '') for col in CART_COLUMNS}
-                )
-
-    if new_items:
-        st.session_state.cart.extend(new_items)
-        st.session_state.gen_pdf_bytes = None
-        st.session_state.gen_excel_bytes = None
-        save_cart_to_db(st.session_state.cart)
-        st.toast(f"Added {len(new_items)} selected items to cart!", icon="\U0001f6d2")
+def is_selected(pid):
+    """Initial checkbox value for a product row."""
+    return pid in st.session_state.cart or pid in selected_pids()
+
+
+def toggle_selection(pid):
+    """on_change callback for a product checkbox."""
+    if st.session_state.get(selection_key(pid)):
+        selected_pids().add(pid)
     else:
-        st.toast("No new items selected.", icon="\u2139\ufe0f")
+        selected_pids().discard(pid)
 
-    if duplicate_count > 0:
-        st.toast(
-            f"{duplicate_count} item(s) already in cart, skipped.",
-            icon="\u2139\ufe0f",
-        )
+
+def _forget_selection(pids):
+    """Untick products that left the cart: drop them from the set and
+    reset their checkbox state so they render unticked."""
+    selected = selected_pids()
+    for pid in pids:
+        selected.discard(pid)
+        st.session_state.pop(selection_key(pid), None)
+
+
+def add_selected_visible_to_cart(df_visible):
+    """Add only the checkbox-selected products that are currently visible.
+    Ticked rows already in the cart are reported as duplicates."""
+    selected = selected_pids()
+    ticked = selected | {
+        pid for pid in st.session_state.cart
+        if st.session_state.get(selection_key(pid))
+    }
+    pids = (
+        df_visible.loc[df_visible['ProductID'].isin(ticked), 'ProductID'].tolist()
+        if ticked else []
+    )
+    added, duplicate_count = _add_pids(pids, label="selected items")
+    # Clear the selection; added rows stay ticked as they are in the cart
+    _forget_selection(list(selected))
+    if not added and not duplicate_count:
+        st.toast("No new items selected.", icon="\u2139\ufe0f")
 
 
 def clear_filters_dropdown():
@@ -8,16 +8,22 @@ import base64
 import time
 import json
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 import requests
+from requests.adapters import HTTPAdapter
 from PIL import Image
 
 import cloudinary
 import cloudinary.api
 import cloudinary.uploader
 
+import image_cache
 from config import (
     CLOUDINARY_CLOUD_NAME, CLOUDINARY_API_KEY, CLOUDINARY_API_SECRET,
-    PRODUCTS_DB_FILE, SAVED_TEMPLATES_FILE,
+    PRODUCTS_DB_FILE, SAVED_TEMPLATES_FILE, IMAGE_FETCH_WORKERS,
+    CLOUDINARY_BREAKER_THRESHOLD, CLOUDINARY_BREAKER_COOLDOWN_SEC, OFFLINE_MODE,
 )
 
 logger = logging.getLogger(__name__)
@@ -35,25 +41,187 @@ def init_cloudinary():
         secure = True
     )
 
+# --- Circuit Breaker & Offline Mode ---
+class CircuitBreaker:
+    """Fail-fast guard for Cloudinary network calls.
+
+    closed    – calls go through; consecutive failures are counted
+    open      – threshold reached; calls are refused until the cooldown ends
+    half-open – cooldown over; one trial call decides whether to close
+                (a trial that never reports back expires after another
+                cooldown, so an early-returning caller can't wedge it)
+    """
+
+    def __init__(self, threshold, cooldown):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self._trial_started = None   # monotonic time of the running trial
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.cooldown:
+            return "half-open"
+        return "open"
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            now = time.monotonic()
+            if state == "half-open" and (
+                self._trial_started is None
+                or now - self._trial_started >= self.cooldown
+            ):
+                self._trial_started = now
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_started = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_started = None
+            if self.failures >= self.threshold or self.opened_at is not None:
+                if self.opened_at is None:
+                    logger.warning(
+                        f"Cloudinary circuit opened after {self.failures} failures"
+                    )
+                self.opened_at = time.monotonic()
+
+
+_breaker = CircuitBreaker(CLOUDINARY_BREAKER_THRESHOLD, CLOUDINARY_BREAKER_COOLDOWN_SEC)
+_offline = OFFLINE_MODE
+
+
+def set_offline_mode(enabled):
+    """Switch offline mode on/off for the whole process."""
+    global _offline
+    _offline = bool(enabled)
+    logger.info(f"Offline mode {'enabled' if _offline else 'disabled'}")
+
+
+def is_offline():
+    return _offline
+
+
+def network_available():
+    """True if a Cloudinary network call may be attempted right now."""
+    return not _offline and _breaker.allow()
+
+
+def cloudinary_status():
+    """Summary for the UI: offline flag, breaker state and failure count."""
+    return {
+        "offline": _offline,
+        "breaker": _breaker.state,
+        "failures": _breaker.failures,
+    }
+
+
+# --- Shared HTTP Session ---
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_http_session():
+    """Return the process-wide pooled HTTP session (keep-alive connections
+    are reused across image fetches and worker threads)."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=4,
+                pool_maxsize=max(IMAGE_FETCH_WORKERS, 10),
+            )
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.headers["User-Agent"] = "Mozilla/5.0"
+            _session = session
+    return _session
+
+
+# --- In-flight Request Coalescing ---
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+def _coalesced(key, fn):
+    """Run fn() once per key at a time; concurrent callers with the same
+    key wait for the first one and share its result."""
+    with _inflight_lock:
+        entry = _inflight.get(key)
+        is_leader = entry is None
+        if is_leader:
+            entry = _inflight[key] = {"done": threading.Event(), "result": None}
+    if not is_leader:
+        entry["done"].wait()
+        return entry["result"]
+    try:
+        entry["result"] = fn()
+        return entry["result"]
+    finally:
+        with _inflight_lock:
+            _inflight.pop(key, None)
+        entry["done"].set()
+
+
 # --- Image Processing ---
-def get_image_as_base64_str(url_or_path, resize=None, max_size=None, retries=2):
-    """Download/open an image and return it as a base64-encoded JPEG string.
+def get_image_jpeg_bytes(url_or_path, resize=None, max_size=None, retries=2):
+    """Download/open an image and return it as JPEG bytes (b"" on failure).
     Supports both HTTP URLs and local file paths.
-    Includes retry logic for network fetches."""
+    Includes retry logic for network fetches; HTTP results are served
+    from the on-disk image cache when available, and concurrent requests
+    for the same image share one download."""
     if not url_or_path:
-        return ""
+        return b""
+    if str(url_or_path).startswith("http"):
+        cache_key = image_cache.make_key(url_or_path, resize, max_size)
+        cached = image_cache.get_bytes(cache_key)
+        if cached:
+            return cached
+        return _coalesced(cache_key, lambda: (
+            image_cache.get_bytes(cache_key)
+            or _load_image_jpeg_bytes(url_or_path, resize, max_size, retries, cache_key)
+        ))
+    return _load_image_jpeg_bytes(url_or_path, resize, max_size, retries)
+
+
+def _load_image_jpeg_bytes(url_or_path, resize, max_size, retries, cache_key=None):
+    """Fetch/open and transcode one image (no cache lookup)."""
+    is_remote = cache_key is not None
     for attempt in range(retries + 1):
         try:
             img = None
-            if str(url_or_path).startswith("http"):
-                headers = {"User-Agent": "Mozilla/5.0"}
-                response = requests.get(url_or_path, headers=headers, timeout=8)
+            if is_remote:
+                if not network_available():
+                    return b""
+                try:
+                    response = get_http_session().get(url_or_path, timeout=8)
+                except requests.exceptions.RequestException:
+                    _breaker.record_failure()
+                    raise
+                if response.status_code >= 500:
+                    _breaker.record_failure()
+                    return b""
+                _breaker.record_success()
                 if response.status_code != 200:
-                    return ""
+                    return b""
                 img = Image.open(io.BytesIO(response.content))
             else:
                 if not os.path.exists(url_or_path):
-                    return ""
+                    return b""
                 img = Image.open(url_or_path)
 
             if max_size:
@@ -65,7 +233,10 @@ def get_image_as_base64_str(url_or_path, resize=None, max_size=None, retries=2):
             if img.mode != "RGB":
                 img = img.convert("RGB")
             img.save(buffered, format="JPEG", quality=85)
-            return base64.b64encode(buffered.getvalue()).decode()
+            jpeg_bytes = buffered.getvalue()
+            if cache_key:
+                image_cache.put(cache_key, jpeg_bytes)
+            return jpeg_bytes
 
         except requests.exceptions.Timeout:
             if attempt < retries:
@@ -73,32 +244,69 @@ def get_image_as_base64_str(url_or_path, resize=None, max_size=None, retries=2):
                 logger.info(f"Retrying image fetch (attempt {attempt + 2}): {url_or_path}")
                 continue
             logger.warning(f"Image fetch timed out after {retries + 1} attempts: {url_or_path}")
-            return ""
+            return b""
         except Exception as e:
             logger.warning(f"Error processing image {url_or_path}: {e}")
-            return ""
-    return ""
+            return b""
+    return b""
+
+
+def get_image_as_base64_str(url_or_path, resize=None, max_size=None, retries=2):
+    """Download/open an image and return it as a base64-encoded JPEG string."""
+    jpeg_bytes = get_image_jpeg_bytes(url_or_path, resize, max_size, retries)
+    return base64.b64encode(jpeg_bytes).decode() if jpeg_bytes else ""
+
+
+def fetch_images_parallel(urls, max_workers=None, loader=None, **kwargs):
+    """Download many images concurrently with a bounded thread pool.
+    Returns a dict of {url: loader result}; duplicates are fetched once.
+    loader defaults to get_image_as_base64_str; extra keyword args are
+    passed through to it."""
+    loader = loader or get_image_as_base64_str
+    unique_urls = [u for u in dict.fromkeys(urls) if u]
+    if not unique_urls:
+        return {}
+    workers = max(1, min(max_workers or IMAGE_FETCH_WORKERS, len(unique_urls)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        results = pool.map(lambda u: loader(u, **kwargs), unique_urls)
+        images = dict(zip(unique_urls, results))
+    logger.info(
+        f"Fetched {sum(1 for v in images.values() if v)}/{len(unique_urls)} "
+        f"images with {workers} workers"
+    )
+    return images
 
 
 # --- Cloudinary Database Backup ---
 def download_db_from_cloudinary():
     """Try to download products_db.json from Cloudinary backup."""
+    if not network_available():
+        logger.info("Cloudinary unavailable (offline or circuit open); skipping DB download")
+        return None
     try:
         res = cloudinary.api.resource("app_data/products_db", resource_type="raw")
         url = res.get("secure_url", "")
         if url:
-            response = requests.get(url, timeout=10)
+            response = get_http_session().get(url, timeout=10)
             if response.status_code == 200:
+                _breaker.record_success()
                 return response.json()
+        _breaker.record_success()
     except cloudinary.exceptions.NotFound:
+        _breaker.record_success()
         logger.info("No products_db found on Cloudinary (first run)")
     except Exception as e:
+        _breaker.record_failure()
         logger.warning(f"Cloudinary DB download failed: {e}")
     return None
 
 
 def upload_db_to_cloudinary(db):
-    """Backup products_db.json to Cloudinary as a raw file."""
+    """Backup products_db.json to Cloudinary as a raw file.
+    Returns True on success."""
+    if not network_available():
+        logger.info("Cloudinary unavailable (offline or circuit open); skipping DB backup")
+        return False
     try:
         data_dir = os.path.dirname(PRODUCTS_DB_FILE)
         if not os.path.exists(data_dir):
@@ -115,72 +323,114 @@ def upload_db_to_cloudinary(db):
         )
         if os.path.exists(temp_path):
             os.remove(temp_path)
+        _breaker.record_success()
         logger.info("Database backed up to Cloudinary")
+        return True
     except Exception as e:
+        _breaker.record_failure()
         logger.error(f"Cloudinary DB backup error: {e}")
+        return False
 
 
 # --- Cloudinary Templates Backup ---
 def download_templates_from_cloudinary():
     """Try to download saved_templates.json from Cloudinary backup."""
+    if not network_available():
+        return None
     try:
         res = cloudinary.api.resource("app_data/saved_templates", resource_type="raw")
         url = res.get("secure_url", "")
         if url:
-            response = requests.get(url, timeout=10)
+            response = get_http_session().get(url, timeout=10)
             if response.status_code == 200:
+                _breaker.record_success()
                 return response.json()
+        _breaker.record_success()
     except cloudinary.exceptions.NotFound:
-        pass
+        _breaker.record_success()
     except Exception as e:
+        _breaker.record_failure()
         logger.warning(f"Cloudinary templates download failed: {e}")
     return None
 
 
-def upload_templates_to_cloudinary():
-    """Backup saved_templates.json to Cloudinary."""
+def upload_templates_to_cloudinary(templates=None):
+    """Backup saved templates to Cloudinary.
+    Uploads saved_templates.json, or the given templates dict if provided.
+    Returns True on success (or when there is nothing to upload)."""
+    if templates is None and not os.path.exists(SAVED_TEMPLATES_FILE):
+        return True
+    if not network_available():
+        logger.info("Cloudinary unavailable (offline or circuit open); skipping templates backup")
+        return False
+    source_path = SAVED_TEMPLATES_FILE
     try:
-        if os.path.exists(SAVED_TEMPLATES_FILE):
-            cloudinary.uploader.upload(
-                SAVED_TEMPLATES_FILE,
-                resource_type="raw",
-                public_id="saved_templates",
-                folder="app_data",
-                overwrite=True,
-            )
-            logger.info("Templates backed up to Cloudinary")
+        if templates is not None:
+            source_path = SAVED_TEMPLATES_FILE + ".upload_tmp"
+            with open(source_path, 'w') as f:
+                json.dump(templates, f, indent=4)
+        cloudinary.uploader.upload(
+            source_path,
+            resource_type="raw",
+            public_id="saved_templates",
+            folder="app_data",
+            overwrite=True,
+        )
+        _breaker.record_success()
+        logger.info("Templates backed up to Cloudinary")
+        if templates is not None and os.path.exists(source_path):
+            os.remove(source_path)
+        return True
     except Exception as e:
+        _breaker.record_failure()
         logger.error(f"Cloudinary templates backup error: {e}")
+        return False
 
 
 # --- Cloudinary Image Indexing ---
-def fetch_all_cloudinary_resources():
+def fetch_all_cloudinary_resources(start_at=None):
     """Fetch all uploaded resources from Cloudinary.
-    Returns a list of resource dicts."""
+    If start_at (ISO-8601) is given, only resources created since then
+    are listed. Returns a list of resource dicts, newest first, or None
+    if the listing is unavailable or incomplete (offline, circuit open,
+    or a page failed), so callers never mistake part of it for the whole."""
     resources = []
+    if not network_available():
+        logger.info("Cloudinary unavailable (offline or circuit open); skipping listing")
+        return None
     try:
         cloudinary.api.ping()
         next_cursor = None
+        options = {"start_at": start_at} if start_at else {}
         while True:
             res = cloudinary.api.resources(
-                type="upload", max_results=500, next_cursor=next_cursor
+                type="upload", max_results=500, next_cursor=next_cursor,
+                **options,
             )
             resources.extend(res.get('resources', []))
             next_cursor = res.get('next_cursor')
             if not next_cursor:
                 break
+        _breaker.record_success()
         logger.info(f"Fetched {len(resources)} resources from Cloudinary")
     except Exception as e:
+        _breaker.record_failure()
         logger.warning(f"Cloudinary resource fetch failed: {e}")
+        return None
     return resources
 
 
 def upload_custom_image(image_file):
     """Upload a custom product image to Cloudinary.
     Returns the secure URL or empty string."""
+    if not network_available():
+        logger.warning("Cloudinary unavailable (offline or circuit open); image not uploaded")
+        return ""
     try:
         res = cloudinary.uploader.upload(image_file, folder="custom_uploads")
+        _breaker.record_success()
         return res.get("secure_url", "")
     except Exception as e:
+        _breaker.record_failure()
         logger.error(f"Custom image upload failed: {e}")
         return ""
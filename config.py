@@ -24,6 +24,18 @@ TEMPLATES_DIR       = os.path.join(BASE_DIR, "templates")
 SAVED_TEMPLATES_FILE= os.path.join(BASE_DIR, "saved_templates.json")
 CUSTOM_ITEMS_FILE   = os.path.join(BASE_DIR, "custom_products.json")   # legacy
 PRODUCTS_DB_FILE    = os.path.join(BASE_DIR, "data", "products_db.json")
+PRODUCTS_SQLITE_FILE= os.path.join(BASE_DIR, "data", "products_db.sqlite3")
+# Storage backend for the products DB: "sqlite" (row-level writes) or
+# "json" (legacy single document). Both are backed up to Cloudinary as JSON.
+DB_BACKEND          = os.environ.get("HEM_DB_BACKEND", "sqlite").lower()
+# JSON backend: edits are appended to this journal and folded into
+# PRODUCTS_DB_FILE every JOURNAL_COMPACT_EVERY records.
+PRODUCTS_DB_JOURNAL_FILE = os.path.join(BASE_DIR, "data", "products_db.journal")
+# JSON backend: one compressed file per saved template.
+TEMPLATE_RECORDS_DIR     = os.path.join(BASE_DIR, "data", "templates")
+JOURNAL_COMPACT_EVERY    = int(os.environ.get("HEM_JOURNAL_COMPACT_EVERY", "200"))
+SYNC_STATE_FILE     = os.path.join(BASE_DIR, "data", "sync_state.json")
+SNAPSHOT_DIR        = os.path.join(BASE_DIR, "data", "snapshot")
 
 # ── Remote image / data URLs ─────────────────────────────────────────────────
 GITHUB_RAW_BASE  = "https://raw.githubusercontent.com/jitu0426/Hem-Export-Catalogue/main/"
@@ -31,6 +43,34 @@ CASE_SIZE_PATH   = f"{GITHUB_RAW_BASE}Case%20Size.xlsx"
 COVER_IMAGE_URL  = "https://res.cloudinary.com/dnoepbfbr/image/upload/v1770703751/Cover_Page.jpg"
 JOURNEY_IMAGE_URL= "https://res.cloudinary.com/dnoepbfbr/image/upload/v1770703751/image-journey.jpg"
 
+# ── Image fetch tuning ───────────────────────────────────────────────────────
+# Number of concurrent downloads used when syncing product images.
+IMAGE_FETCH_WORKERS = int(os.environ.get("IMAGE_FETCH_WORKERS", "8"))
+
+# ── Cloudinary resilience ───────────────────────────────────────────────────
+# After BREAKER_THRESHOLD consecutive network failures all Cloudinary calls
+# fail fast for BREAKER_COOLDOWN_SEC, then one trial call is let through.
+# OFFLINE_MODE skips the network entirely (cached images + local DB only).
+CLOUDINARY_BREAKER_THRESHOLD    = int(os.environ.get("CLOUDINARY_BREAKER_THRESHOLD", "5"))
+CLOUDINARY_BREAKER_COOLDOWN_SEC = float(os.environ.get("CLOUDINARY_BREAKER_COOLDOWN_SEC", "60"))
+OFFLINE_MODE = os.environ.get("HEM_OFFLINE_MODE", "").lower() in ("1", "true", "yes")
+# DB/template backups run in the background, at most once per interval.
+BACKUP_INTERVAL_SEC = float(os.environ.get("HEM_BACKUP_INTERVAL_SEC", "30"))
+
+# ── Local image cache (transcoded JPEGs, LRU-evicted) ───────────────────────
+IMAGE_CACHE_DIR    = os.path.join(BASE_DIR, "data", "image_cache")
+IMAGE_CACHE_MAX_MB = int(os.environ.get("IMAGE_CACHE_MAX_MB", "500"))
+IMAGE_STORE_INDEX_FILE = os.path.join(BASE_DIR, "data", "image_store.json")
+
+# ── Image variants (name → longest side in px) ──────────────────────────────
+# 'print' is what the sync downloads from Cloudinary; smaller variants are
+# derived from it locally and cached on disk.
+IMAGE_VARIANTS = {
+    "thumb": 72,    # filter-list thumbnails (rendered at 36px)
+    "card":  300,   # PDF product cards and TOC cards
+    "print": 800,   # full-size source image
+}
+
 # ── Excel catalogue file paths ───────────────────────────────────────────────
 # Keys are the catalogue display names; values are local Excel file paths.
 CATALOGUE_PATHS = {
@@ -52,6 +92,7 @@ GLOBAL_COLUMN_MAPPING = {
 }
 
 # ── Required columns in the output DataFrame ─────────────────────────────────
+# 'ImageB64' holds an image handle (see image_store.py), not inline data.
 REQUIRED_OUTPUT_COLS = [
     'Category', 'Subcategory', 'ItemName', 'Fragrance', 'SKU Code',
     'Catalogue', 'Packaging', 'ImageB64', 'ProductID', 'IsNew',
@@ -63,6 +104,10 @@ CART_COLUMNS = [
     'Packaging', 'SerialNo', 'ImageB64', 'Catalogue', 'ProductID', 'IsNew',
 ]
 
+# ── Product list pagination (rows rendered per category page) ───────────────
+PRODUCT_LIST_PAGE_SIZE = int(os.environ.get("HEM_PRODUCT_LIST_PAGE_SIZE", "25"))
+PRODUCT_LIST_PAGE_SIZES = [10, 25, 50, 100]
+
 # ── UI text constants ─────────────────────────────────────────────────────────
 NO_SELECTION_PLACEHOLDER = "Select..."
 APP_TITLE = "HEM PRODUCT CATALOGUE"
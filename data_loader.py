@@ -2,19 +2,27 @@
 HEM Product Catalogue - Data Loader Module
 Excel loading, Cloudinary image matching, and cached data pipeline.
 """
+import os
+import copy
+import json
 import hashlib
 import logging
+import threading
+from collections import OrderedDict
+from collections.abc import Mapping
 
 import pandas as pd
 import streamlit as st
 
 from config import (
     CATALOGUE_PATHS, GLOBAL_COLUMN_MAPPING, REQUIRED_OUTPUT_COLS,
+    SYNC_STATE_FILE, IMAGE_VARIANTS,
 )
-from cloudinary_client import (
-    get_image_as_base64_str, fetch_all_cloudinary_resources,
-)
+from cloudinary_client import fetch_all_cloudinary_resources
 from database import load_products_db
+from image_matcher import ImageMatcher, clean_key
+from image_store import register_many, is_handle
+from snapshot import load_snapshot, save_snapshot, clear_snapshot
 
 logger = logging.getLogger(__name__)
 
@@ -30,24 +38,47 @@ def generate_stable_product_id(catalogue, category, item_name, sku_code=""):
     return f"PID_{hashlib.md5(raw.encode()).hexdigest()[:12]}"
 
 
-def clean_key(text):
-    """Normalize text for fuzzy image key matching.
-    Removes extensions, spaces, special chars, lowercases."""
-    if not isinstance(text, str):
-        return ""
-    text = text.lower().strip()
-    for ext in ['.jpg', '.jpeg', '.png', '.webp', '.bmp', '.tiff']:
-        if text.endswith(ext):
-            text = text[:-len(ext)]
-    text = (text
-            .replace('\u00a0', '')
-            .replace(' ', '')
-            .replace('_', '')
-            .replace('-', '')
-            .replace('/', '')
-            .replace('\\', '')
-            .replace('.', ''))
-    return text
+def generate_stable_product_ids(catalogue, df):
+    """Vectorized generate_stable_product_id over a whole catalogue frame.
+    Returns a Series of ProductIDs aligned with df."""
+    def column(name):
+        if name in df.columns:
+            return df[name].astype(str)
+        return pd.Series("", index=df.index)
+
+    raw = (
+        f"{catalogue}|" + column('Category') + "|" + column('ItemName')
+        + "|" + column('SKU Code')
+    ).str.strip().str.lower()
+    return pd.Series(
+        [f"PID_{hashlib.md5(r.encode()).hexdigest()[:12]}" for r in raw],
+        index=df.index,
+    )
+
+
+def apply_product_overrides(df, overrides):
+    """Apply sparse {pid: {field: value}} overrides to df in bulk.
+    Pivots the overrides into a PID × field frame and joins it on
+    ProductID, so cost grows with rows × edited fields, not with
+    rows × overridden products."""
+    if not overrides or df.empty:
+        return df
+    override_df = pd.DataFrame.from_dict(overrides, orient='index')
+    for field in override_df.columns:
+        if field not in df.columns:
+            continue
+        values = override_df[field].dropna()
+        mapped = df['ProductID'].map(values)
+        hit = mapped.notna()
+        if hit.any():
+            dtype = df[field].dtype
+            patched = df[field].where(~hit, mapped)
+            try:
+                patched = patched.astype(dtype)   # where() upcasts ints
+            except (ValueError, TypeError):
+                pass   # edit doesn't fit the old dtype; keep the upcast
+            df[field] = patched
+    return df
 
 
 def create_safe_id(text):
@@ -59,171 +90,581 @@ def create_safe_id(text):
 
 
 # =========================================================================
-# Main Data Loading Pipeline
+# Incremental Sync State
 # =========================================================================
+# On disk we remember each workbook's content hash and the Cloudinary
+# listing (public_id, url, version, created_at). In process memory we keep
+# the parsed frame per catalogue and the images from the previous sync, so
+# a refresh only re-reads changed workbooks and only downloads images whose
+# URL (which embeds the Cloudinary version) changed.
 
-@st.cache_data(show_spinner="Syncing Data (Smart Match v5 + Persistent DB)...")
-def load_data_cached(_dummy_timestamp):
-    """Load all product data from Excel files, Cloudinary images, and custom products.
+_URL_COL = "_ImageURL"
+_parsed_catalogues = {}   # catalogue name → (file hash, parsed DataFrame)
+_image_memo = {}          # optimized image URL → image handle from last sync
 
-    Uses Streamlit cache; pass a changing timestamp to bust the cache.
-    The underscore prefix on _dummy_timestamp tells Streamlit not to hash it.
-    """
-    all_data = []
-    required_output_cols = REQUIRED_OUTPUT_COLS
 
-    # --- A. CLOUDINARY IMAGE INDEXING ---
-    cloudinary_map = {}
-    filename_map = {}
-    debug_log = ["--- SYNC START ---"]
+# =========================================================================
+# Cache Layers
+# =========================================================================
+# The composed frame (load_data_cached) is built from independently cached
+# layers. Inputs living outside the process must be invalidated explicitly:
+#   source – Excel workbooks (re-hashed, changed ones re-parsed)
+#   images – Cloudinary listing, ImageMatcher and per-product matches
+# A dirty layer is re-checked on the next data_version() / compose; the
+# composed frame is keyed by data version, so it is only rebuilt when a
+# layer's content actually changed. DB inputs (overrides, hidden and
+# custom products) need no invalidation: the DB replaces a collection on
+# every change, and the data version and custom frame track them by
+# identity.
+
+DATA_LAYERS = ("source", "images")
+_dirty_layers = {"source"}   # "images" is re-listed on demand
+_layer_cache = {
+    "state": None,              # images: sync state (listing), loaded once
+    "catalogue_hashes": None,   # source: catalogue name → file hash
+    "matcher": None,            # images: ImageMatcher over the listing
+    "matches": {},              # images: (catalogue, category, item) → url
+    "custom": None,             # (DB custom_products list, its frame)
+}
+
+
+def invalidate_data(*layers):
+    """Invalidate the named cache layers (all layers if none are given).
+    The next data_version() re-checks them; "images" re-lists Cloudinary."""
+    unknown = set(layers) - set(DATA_LAYERS)
+    if unknown:
+        raise ValueError(f"Unknown data layer(s): {sorted(unknown)}")
+    _dirty_layers.update(layers or DATA_LAYERS)
+    if not layers or "images" in layers:
+        # Image URLs missing from _image_memo are retried only by a
+        # re-compose; the data version alone would keep the gaps cached.
+        with _frames_lock:
+            for version in _incomplete_frames:
+                _frames.pop(version, None)
+                _pid_indexes.pop(version, None)
+            _incomplete_frames.clear()
+
+
+def _file_hash(path):
+    """SHA-256 of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _load_sync_state():
+    if os.path.exists(SYNC_STATE_FILE):
+        try:
+            with open(SYNC_STATE_FILE, 'r') as f:
+                return json.load(f)
+        except (json.JSONDecodeError, OSError) as e:
+            logger.warning(f"Failed to load sync state: {e}")
+    return {"catalogues": {}, "resources": [], "latest_created_at": ""}
 
+
+def _save_sync_state(state):
     try:
-        resources = fetch_all_cloudinary_resources()
-        for res in resources:
-            public_id = res['public_id']
-            url = res['secure_url']
-            full_key = clean_key(public_id)
-            cloudinary_map[full_key] = url
-            f_name = public_id.split('/')[-1]
-            file_key = clean_key(f_name)
-            if file_key not in filename_map:
-                filename_map[file_key] = url
+        os.makedirs(os.path.dirname(SYNC_STATE_FILE), exist_ok=True)
+        with open(SYNC_STATE_FILE, 'w') as f:
+            json.dump(state, f)
+    except OSError as e:
+        logger.warning(f"Failed to save sync state: {e}")
+
+
+def reset_sync_state():
+    """Forget all incremental state so the next load is a full resync."""
+    _parsed_catalogues.clear()
+    _image_memo.clear()
+    _frames.clear()
+    _incomplete_frames.clear()
+    _pid_indexes.clear()
+    _layer_cache["state"] = None
+    _dirty_layers.update(DATA_LAYERS)
+    clear_snapshot()
+    if os.path.exists(SYNC_STATE_FILE):
+        os.remove(SYNC_STATE_FILE)
+
+
+def _sync_cloudinary_resources(state):
+    """Update the remembered Cloudinary listing and return it.
+    With a previous listing, only resources created since the newest known
+    one are fetched; new or re-uploaded resources move to the front to keep
+    Cloudinary's newest-first order. A failed or partial fetch keeps the
+    known listing untouched."""
+    known = state.get("resources", [])
+    start_at = state.get("latest_created_at") if known else None
+    fetched = fetch_all_cloudinary_resources(start_at=start_at)
+    if not fetched:
+        return known
+
+    fresh = [
+        {
+            "public_id": r["public_id"],
+            "secure_url": r["secure_url"],
+            "version": r.get("version"),
+            "created_at": r.get("created_at", ""),
+        }
+        for r in fetched
+    ]
+    if start_at:
+        fresh_ids = {r["public_id"] for r in fresh}
+        fresh += [r for r in known if r["public_id"] not in fresh_ids]
+    state["resources"] = fresh
+    state["latest_created_at"] = max(
+        (r["created_at"] for r in fresh if r["created_at"]), default=""
+    )
+    return fresh
+
+
+def _parse_catalogue_excel(catalogue_name, excel_path):
+    """Read one catalogue workbook into the normalized product frame
+    (before deletions, overrides and image matching)."""
+    df = pd.read_excel(excel_path, sheet_name=0, dtype=str)
+    df = df.fillna("")
+    df.columns = [str(c).strip() for c in df.columns]
+    df.rename(
+        columns={
+            k.strip(): v
+            for k, v in GLOBAL_COLUMN_MAPPING.items()
+            if k.strip() in df.columns
+        },
+        inplace=True,
+    )
+
+    df['Catalogue'] = catalogue_name
+    df['Packaging'] = 'Default Packaging'
+    df["ImageB64"] = ""
+    df[_URL_COL] = ""
+    df['IsNew'] = (
+        pd.to_numeric(df.get('IsNew', 0), errors='coerce')
+        .fillna(0)
+        .astype(int)
+    )
+
+    # DETERMINISTIC ProductID (stable across reboots)
+    df["ProductID"] = generate_stable_product_ids(catalogue_name, df)
+
+    for col in REQUIRED_OUTPUT_COLS:
+        if col not in df.columns:
+            df[col] = '' if col != 'IsNew' else 0
+    return df
+
+
+# =========================================================================
+# Cold-Start Snapshot
+# =========================================================================
+
+_snapshot_status = {"used": False, "stale": False}
+
+
+_token_memo = {}   # id-keyed memo of the expensive token parts
+
+
+def _memo_digest(name, parts, build):
+    """md5 of build(), recomputed only when the identity of any object in
+    parts changes (DB collections and the listing are replaced, never
+    mutated in place)."""
+    ids = tuple(id(p) for p in parts)
+    cached = _token_memo.get(name)
+    if cached is None or cached[0] != ids:
+        payload = json.dumps(build(), sort_keys=True, default=str)
+        # Hold on to parts so their ids cannot be reused while memoized
+        cached = (ids, hashlib.md5(payload.encode()).hexdigest(), parts)
+        _token_memo[name] = cached
+    return cached[1]
+
+
+def _source_token(catalogue_hashes, state, db):
+    """Fingerprint of every input that shapes the merged catalogue frame."""
+    resources = state.get("resources", [])
+    overrides = db.get("product_overrides", {})
+    deleted = db.get("deleted_products", [])
+    custom = db.get("custom_products", [])
+    return {
+        "catalogues": catalogue_hashes,
+        "cloudinary": _memo_digest(
+            "cloudinary", (resources,),
+            lambda: [(r["public_id"], r.get("version")) for r in resources],
+        ),
+        "db": _memo_digest(
+            "db", (overrides, deleted, custom),
+            lambda: [overrides, sorted(deleted), custom],
+        ),
+    }
+
+
+def _validate_snapshot_async(state):
+    """Check Cloudinary for new/re-uploaded images in the background and
+    flag the snapshot as stale if the listing changed."""
+    state = copy.deepcopy(state)
+
+    def _check():
+        def fingerprint(resources):
+            return [(r["public_id"], r.get("version")) for r in resources]
+        before = fingerprint(state.get("resources", []))
+        after = fingerprint(_sync_cloudinary_resources(state))
+        if after != before:
+            _snapshot_status["stale"] = True
+            logger.info("Catalogue snapshot is stale: Cloudinary listing changed")
+
+    threading.Thread(target=_check, name="snapshot-validate", daemon=True).start()
+
+
+def is_snapshot_stale():
+    """True if the catalogue was served from a snapshot that is now outdated."""
+    return _snapshot_status["stale"]
+
+
+# =========================================================================
+# Main Data Loading Pipeline
+# =========================================================================
+
+def _sync_state():
+    """The sync state (workbook hashes + Cloudinary listing), kept in memory.
+    With no stored listing the first use lists Cloudinary; otherwise a
+    background check flags new uploads (see is_snapshot_stale)."""
+    if _layer_cache["state"] is None:
+        state = _load_sync_state()
+        _layer_cache["state"] = state
+        if state.get("resources"):
+            _validate_snapshot_async(state)
+        else:
+            _dirty_layers.add("images")
+    return _layer_cache["state"]
+
+
+def _catalogue_hashes():
+    """Workbook content hashes (source layer)."""
+    if "source" in _dirty_layers or _layer_cache["catalogue_hashes"] is None:
+        _layer_cache["catalogue_hashes"] = {
+            name: _file_hash(path)
+            for name, path in CATALOGUE_PATHS.items()
+            if os.path.exists(path)
+        }
+        _dirty_layers.discard("source")
+    return _layer_cache["catalogue_hashes"]
+
+
+def _refresh_listing(state):
+    """Re-list Cloudinary (images layer); drops the matcher if it changed."""
+    before = state.get("resources")
+    try:
+        _sync_cloudinary_resources(state)
     except Exception as e:
         st.warning(f"Cloudinary Warning: {e}")
+    if state.get("resources") is not before:
+        _layer_cache["matcher"] = None
+        _save_sync_state(state)
+    _dirty_layers.discard("images")
+    _snapshot_status["stale"] = False
+
+
+def _image_matcher(state):
+    """ImageMatcher over the known Cloudinary listing (images layer)."""
+    if _layer_cache["matcher"] is None:
+        _layer_cache["matcher"] = ImageMatcher(state.get("resources", []))
+        _layer_cache["matches"] = {}
+    return _layer_cache["matcher"]
+
+
+def data_version():
+    """Content-derived token of everything the products frame is built
+    from: workbook hashes, the Cloudinary listing and the DB catalogue
+    data. Equal tokens mean an identical frame, so every session shares
+    one cached frame and a no-op refresh is free. Cheap unless a layer
+    was invalidated."""
+    with _frames_lock:
+        state = _sync_state()
+        catalogue_hashes = _catalogue_hashes()
+        if "images" in _dirty_layers:
+            _refresh_listing(state)
+        return _version_of(catalogue_hashes, state, load_products_db())
+
+
+def _version_of(catalogue_hashes, state, db):
+    token = _source_token(catalogue_hashes, state, db)
+    return hashlib.md5(json.dumps(token, sort_keys=True).encode()).hexdigest()
+
+
+def _matched_urls(matcher, df, debug_log):
+    """Optimized image URL per row ("" if none), memoized per
+    (catalogue, category, item) so re-composing only matches new keys."""
+    memo = _layer_cache["matches"]
+    urls = []
+    for key in zip(df['Catalogue'], df['Category'], df['ItemName']):
+        if key not in memo:
+            found_url, match_type = matcher.match(*key)
+            item = clean_key(str(key[2]))
+            if "soham" in item or "bayleaf" in item:
+                debug_log.append(
+                    f"Product: {key[2]} | "
+                    f"Found: {found_url is not None} | Type: {match_type}"
+                )
+            memo[key] = found_url.replace(
+                "/upload/",
+                f"/upload/w_{IMAGE_VARIANTS['print']},q_auto/",
+            ) if found_url else ""
+        urls.append(memo[key])
+    return urls
 
-    # --- B. LOAD PRODUCTS DATABASE ---
-    db = load_products_db()
+
+def _custom_frame(db):
+    """Custom products as catalogue rows, rebuilt only when the DB's
+    custom_products list was replaced."""
+    custom_items = db.get("custom_products", [])
+    cached = _layer_cache["custom"]
+    if cached is None or cached[0] is not custom_items:
+        custom_df = pd.DataFrame(custom_items)
+        if not custom_df.empty:
+            for col in REQUIRED_OUTPUT_COLS:
+                if col not in custom_df.columns:
+                    custom_df[col] = '' if col != 'IsNew' else 0
+            is_url = custom_df['ImageB64'].astype(str).str.startswith('http')
+            custom_df[_URL_COL] = custom_df['ImageB64'].where(is_url, "")
+            custom_df = custom_df[REQUIRED_OUTPUT_COLS + [_URL_COL]]
+        _layer_cache["custom"] = (custom_items, custom_df)
+    return _layer_cache["custom"][1]
+
+
+def _build_catalogue_frame(state, db, catalogue_hashes, debug_log):
+    """Compose the merged frame from the cache layers (steps A–D).
+    Returns the merged frame with matched image URLs, without images."""
+    all_data = []
+    required_output_cols = REQUIRED_OUTPUT_COLS
+    url_col = _URL_COL
+
+    # --- A. CLOUDINARY IMAGE INDEXING ---
+    matcher = _image_matcher(state)
+
+    # --- B. PRODUCTS DATABASE ---
     overrides = db.get("product_overrides", {})
     deleted_pids = set(db.get("deleted_products", []))
 
     # --- C. EXCEL LOADING & MATCHING ---
-    for catalogue_name, excel_path in CATALOGUE_PATHS.items():
-        import os
-        if not os.path.exists(excel_path):
-            continue
+    for catalogue_name, file_hash in catalogue_hashes.items():
+        excel_path = CATALOGUE_PATHS[catalogue_name]
         try:
-            df = pd.read_excel(excel_path, sheet_name=0, dtype=str)
-            df = df.fillna("")
-            df.columns = [str(c).strip() for c in df.columns]
-            df.rename(
-                columns={
-                    k.strip(): v
-                    for k, v in GLOBAL_COLUMN_MAPPING.items()
-                    if k.strip() in df.columns
-                },
-                inplace=True,
-            )
-
-            df['Catalogue'] = catalogue_name
-            df['Packaging'] = 'Default Packaging'
-            df["ImageB64"] = ""
-            df['IsNew'] = (
-                pd.to_numeric(df.get('IsNew', 0), errors='coerce')
-                .fillna(0)
-                .astype(int)
-            )
-
-            # DETERMINISTIC ProductID (stable across reboots)
-            df["ProductID"] = df.apply(
-                lambda row: generate_stable_product_id(
-                    catalogue_name,
-                    str(row.get('Category', '')),
-                    str(row.get('ItemName', '')),
-                    str(row.get('SKU Code', '')),
-                ),
-                axis=1,
-            )
-
-            for col in required_output_cols:
-                if col not in df.columns:
-                    df[col] = '' if col != 'IsNew' else 0
+            cached = _parsed_catalogues.get(catalogue_name)
+            if cached and cached[0] == file_hash:
+                df = cached[1].copy()
+            else:
+                parsed = _parse_catalogue_excel(catalogue_name, excel_path)
+                _parsed_catalogues[catalogue_name] = (file_hash, parsed)
+                df = parsed.copy()
+                debug_log.append(f"Re-read workbook: {catalogue_name}")
 
             # REMOVE DELETED PRODUCTS
             if deleted_pids:
                 df = df[~df['ProductID'].isin(deleted_pids)]
 
             # APPLY PRODUCT OVERRIDES (sparse merge)
-            if overrides:
-                for pid, changes in overrides.items():
-                    mask = df['ProductID'] == pid
-                    if mask.any():
-                        for field, value in changes.items():
-                            if field in df.columns:
-                                df.loc[mask, field] = value
+            df = apply_product_overrides(df, overrides)
 
             # CLOUDINARY IMAGE MATCHING
-            if cloudinary_map:
-                for index, row in df.iterrows():
-                    cat = clean_key(str(row.get('Catalogue', '')))
-                    category = clean_key(str(row.get('Category', '')))
-                    item = clean_key(str(row.get('ItemName', '')))
-
-                    found_url = None
-                    match_type = "None"
-
-                    key_1 = cat + category + item
-                    key_2 = category + item
-                    key_3 = item
-
-                    if key_1 in cloudinary_map:
-                        found_url = cloudinary_map[key_1]
-                        match_type = "Exact Path"
-                    elif key_2 in cloudinary_map:
-                        found_url = cloudinary_map[key_2]
-                        match_type = "Category Path"
-                    elif key_3 in filename_map:
-                        found_url = filename_map[key_3]
-                        match_type = "Exact Filename"
-
-                    if not found_url:
-                        for c_key, c_url in filename_map.items():
-                            if len(c_key) < 4:
-                                continue
-                            if item.startswith(c_key):
-                                found_url = c_url
-                                match_type = f"Partial: Item starts with '{c_key}'"
-                                break
-                            if c_key.startswith(item):
-                                found_url = c_url
-                                match_type = f"Partial: File starts with '{item}'"
-                                break
-
-                    if "soham" in item or "bayleaf" in item:
-                        debug_log.append(
-                            f"Product: {row.get('ItemName')} | "
-                            f"Found: {found_url is not None} | Type: {match_type}"
-                        )
-
-                    if found_url:
-                        optimized_url = found_url.replace(
-                            "/upload/", "/upload/w_800,q_auto/"
-                        )
-                        df.loc[index, "ImageB64"] = get_image_as_base64_str(
-                            optimized_url, max_size=None
-                        )
-
-            all_data.append(df[required_output_cols])
+            if len(matcher):
+                df[url_col] = _matched_urls(matcher, df, debug_log)
+
+            all_data.append(df[required_output_cols + [url_col]])
         except Exception as e:
             st.error(f"Error reading Excel {catalogue_name}: {e}")
             logger.error(f"Error reading Excel {catalogue_name}: {e}")
 
-    # --- D. CUSTOM PRODUCTS FROM DATABASE ---
-    custom_items = db.get("custom_products", [])
-    if custom_items:
-        custom_df = pd.DataFrame(custom_items)
-        for col in required_output_cols:
-            if col not in custom_df.columns:
-                custom_df[col] = '' if col != 'IsNew' else 0
-
-        for idx, row in custom_df.iterrows():
-            if str(row['ImageB64']).startswith('http'):
-                custom_df.at[idx, 'ImageB64'] = get_image_as_base64_str(
-                    row['ImageB64']
-                )
+    for stale in set(_parsed_catalogues) - set(catalogue_hashes):
+        del _parsed_catalogues[stale]
 
-        all_data.append(custom_df[required_output_cols])
+    # --- D. CUSTOM PRODUCTS FROM DATABASE ---
+    custom_df = _custom_frame(db)
+    if not custom_df.empty:
+        # Review-tab edits apply to custom products too (the cached
+        # layer stays pristine)
+        all_data.append(apply_product_overrides(custom_df.copy(), overrides))
 
-    st.session_state['debug_logs'] = debug_log
     if not all_data:
-        return pd.DataFrame(columns=required_output_cols)
+        return pd.DataFrame(columns=required_output_cols + [url_col])
     return pd.concat(all_data, ignore_index=True)
+
+
+_frames = OrderedDict()   # data version → composed frame (all sessions)
+_incomplete_frames = set()   # versions composed while images failed to register
+_FRAME_CACHE_SIZE = 2
+_frames_lock = threading.RLock()
+
+
+# Fields the image match is keyed on; edits to them need a re-compose
+_MATCH_FIELDS = ("Catalogue", "Category", "ItemName")
+
+
+def patch_loaded_frame(overrides, version):
+    """Apply {pid: {field: value}} edits to a copy of the frame cached for
+    version (the data version before the edits were saved) and cache it
+    under the current version, so saved overrides show up without
+    re-composing. The cached frame itself is never mutated: other
+    sessions may be reading it.
+
+    Returns False if that frame is not cached or an edit touches a field
+    used for image matching, since only a re-compose re-matches images;
+    the saved edits already changed the data version, so the next load
+    re-composes on its own."""
+    if any(f in _MATCH_FIELDS for delta in overrides.values() for f in delta):
+        return False
+    with _frames_lock:
+        frame = _frames.get(version)
+        if frame is None:
+            return False
+        frame = apply_product_overrides(frame.copy(), overrides)
+        current = data_version()
+        _frames[current] = frame
+        if version in _incomplete_frames:
+            _incomplete_frames.add(current)
+        while len(_frames) > _FRAME_CACHE_SIZE:
+            _frames.popitem(last=False)
+    return True
+
+
+def load_data_cached(version=None):
+    """Return the products frame for a data version (default: current).
+
+    Frames are cached per data_version() and shared by every session;
+    treat the result as read-only (see patch_loaded_frame). A version
+    that is no longer cached (e.g. a fragment rerun holding an older
+    version) is served the current frame instead.
+    """
+    return load_versioned_data(version)[1]
+
+
+def load_versioned_data(version=None):
+    """Return (data version, frame). The version is the one the frame was
+    actually composed from, which differs from the requested one when
+    that is stale or the data changed while composing."""
+    with _frames_lock:
+        if version not in _frames:
+            version = data_version()
+        if version in _frames:
+            _frames.move_to_end(version)
+            return version, _frames[version]
+        with st.spinner("Syncing Data (Smart Match v5 + Persistent DB)..."):
+            version, frame, complete = _compose_frame()
+        _frames[version] = frame
+        if complete:
+            _incomplete_frames.discard(version)
+        else:
+            _incomplete_frames.add(version)
+        while len(_frames) > _FRAME_CACHE_SIZE:
+            _frames.popitem(last=False)
+        return version, frame
+
+
+class PidIndex(Mapping):
+    """Read-only ProductID → row dict view of one products frame.
+
+    Holds a ProductID → position map plus the frame's columns as lists,
+    so a lookup builds one small dict instead of touching pandas. Rows
+    are fresh dicts; changing them never affects the frame."""
+
+    def __init__(self, frame):
+        self._positions = {
+            pid: pos for pos, pid in enumerate(frame["ProductID"].tolist())
+        } if "ProductID" in frame.columns else {}
+        self._columns = {col: frame[col].tolist() for col in frame.columns}
+
+    def __getitem__(self, pid):
+        pos = self._positions[pid]
+        return {col: values[pos] for col, values in self._columns.items()}
+
+    def __contains__(self, pid):
+        return pid in self._positions
+
+    def __iter__(self):
+        return iter(self._positions)
+
+    def __len__(self):
+        return len(self._positions)
+
+    def position(self, pid):
+        """Row position of pid in the frame, or None."""
+        return self._positions.get(pid)
+
+
+_pid_indexes = OrderedDict()   # data version → PidIndex (all sessions)
+
+
+def pid_index(version=None):
+    """Return the PidIndex for a data version (default: current), built
+    once per version and shared by every session."""
+    with _frames_lock:
+        version, frame = load_versioned_data(version)
+        index = _pid_indexes.get(version)
+        if index is None:
+            index = PidIndex(frame)
+            _pid_indexes[version] = index
+            while len(_pid_indexes) > _FRAME_CACHE_SIZE:
+                _pid_indexes.popitem(last=False)
+        else:
+            _pid_indexes.move_to_end(version)
+        return index
+
+
+def _compose_frame():
+    """Load all product data from Excel files, Cloudinary images, and custom products.
+    Returns (data version of the inputs used, frame, whether every image
+    registered).
+
+    Syncs incrementally: unchanged workbooks and images are reused from
+    the previous run (call reset_sync_state() first for a full resync).
+    The first load in a fresh process is served from the on-disk snapshot
+    when its sources are unchanged.
+    """
+    required_output_cols = REQUIRED_OUTPUT_COLS
+    # Matched image URLs are collected in this column and downloaded
+    # in one parallel pass once every catalogue has been matched.
+    url_col = _URL_COL
+    debug_log = ["--- SYNC START ---"]
+    state = _sync_state()
+    db = load_products_db()
+    catalogue_hashes = _catalogue_hashes()
+
+    final_df = None
+    snapshot_token = None
+    if not _parsed_catalogues and not _snapshot_status["used"]:
+        final_df = load_snapshot(_source_token(catalogue_hashes, state, db))
+        if final_df is not None:
+            debug_log.append("Loaded from catalogue snapshot")
+            _image_memo.update(
+                (u, h) for u, h in zip(final_df[url_col], final_df["ImageB64"])
+                if u and is_handle(h)
+            )
+    _snapshot_status["used"] = True
+
+    if final_df is None:
+        final_df = _build_catalogue_frame(state, db, catalogue_hashes, debug_log)
+        state["catalogues"] = catalogue_hashes
+        _save_sync_state(state)
+        snapshot_token = _source_token(catalogue_hashes, state, db)
+
+    st.session_state['debug_logs'] = debug_log
+    version = _version_of(catalogue_hashes, state, db)
+    if final_df.empty:
+        return version, pd.DataFrame(columns=required_output_cols), True
+
+    # --- E. PARALLEL IMAGE DOWNLOAD (only URLs not seen last sync) ---
+    # Rows get lightweight image handles; bytes stay in the image store.
+    urls = [u for u in final_df[url_col].unique() if u]
+    images = {u: _image_memo[u] for u in urls if _image_memo.get(u)}
+    reused = len(images)
+    images.update(register_many(u for u in urls if u not in images))
+    _image_memo.clear()
+    _image_memo.update(images)
+    final_df["ImageB64"] = final_df[url_col].map(images).fillna(final_df["ImageB64"])
+    missing = sum(1 for u in urls if not images.get(u))
+    debug_log.append(
+        f"Images: {len(urls)} unique URLs, {reused} reused, {missing} missing"
+    )
+    # A snapshot is trusted on the next cold start, so never persist rows
+    # whose images failed to register.
+    if snapshot_token and not missing:
+        save_snapshot(final_df, snapshot_token)
+    elif snapshot_token:
+        debug_log.append("Snapshot skipped: some images failed to register")
+    return version, final_df[required_output_cols].copy(), not missing
@@ -1,17 +1,30 @@
 """
 HEM Product Catalogue - Database Module
-Persistent JSON database with session-state caching.
-Eliminates redundant disk reads (15+ per render -> 1).
+Persistent products database with a process-wide shared cache.
+Each access costs a stat() of the store files; the DB is only re-read
+when another session or process actually changed it.
+Storage is SQLite (row-level writes) or a JSON snapshot plus an
+append-only change journal, selected by DB_BACKEND.
 """
 import os
 import json
+import zlib
 import uuid
+import base64
+import hashlib
 import logging
+import threading
 from datetime import datetime
 
 import streamlit as st
 
-from config import PRODUCTS_DB_FILE, CUSTOM_ITEMS_FILE, SAVED_TEMPLATES_FILE
+import sqlite_store
+import db_journal
+import backup_worker
+from config import (
+    PRODUCTS_DB_FILE, CUSTOM_ITEMS_FILE, SAVED_TEMPLATES_FILE, TEMPLATE_RECORDS_DIR,
+    DB_BACKEND,
+)
 from cloudinary_client import (
     download_db_from_cloudinary, upload_db_to_cloudinary,
     download_templates_from_cloudinary, upload_templates_to_cloudinary,
@@ -37,10 +50,13 @@ def get_empty_products_db():
 
 
 # =========================================================================
-# Core Load / Save with Session-State Caching
+# Core Load / Save with a Process-Wide Shared Cache
 # =========================================================================
 
-_DB_CACHE_KEY = "_products_db_cache"
+# One copy of the DB shared by every session in this process. Mutations
+# replace it copy-on-write (see db_journal.OPS) under _db_lock.
+_db_lock = threading.RLock()
+_shared = {"db": None, "version": None}
 
 
 def _load_from_disk_or_cloud():
@@ -73,29 +89,128 @@ def _load_from_disk_or_cloud():
 
 def _write_to_disk(db):
     """Write DB to local disk."""
-    data_dir = os.path.dirname(PRODUCTS_DB_FILE)
-    if not os.path.exists(data_dir):
-        os.makedirs(data_dir)
-    with open(PRODUCTS_DB_FILE, 'w') as f:
-        json.dump(db, f, indent=2)
+    db_journal.write_snapshot(db)
+
+
+def _use_sqlite():
+    return DB_BACKEND == "sqlite"
+
+
+# =========================================================================
+# Cloudinary Backups (write-behind, see backup_worker)
+# =========================================================================
+
+def _backup_db_job():
+    """Upload the currently persisted DB (runs on the backup thread)."""
+    if _use_sqlite():
+        return upload_db_to_cloudinary(sqlite_store.load_all())
+    db = db_journal.replay(db_journal.read_snapshot(get_empty_products_db))
+    return upload_db_to_cloudinary(db)
+
+
+def _backup_templates_job():
+    """Upload the currently persisted templates (runs on the backup thread)."""
+    return upload_templates_to_cloudinary(_template_records())
+
+
+def schedule_db_backup():
+    backup_worker.schedule("db", _backup_db_job)
+
+
+def schedule_templates_backup():
+    backup_worker.schedule("templates", _backup_templates_job)
+
+
+def _load_from_store():
+    """Load DB from the configured backend.
+    JSON: snapshot + journal replay. The first SQLite load migrates the
+    JSON snapshot/journal (or the Cloudinary backup)."""
+    if not _use_sqlite():
+        return db_journal.replay(_load_from_disk_or_cloud())
+    if sqlite_store.is_initialized():
+        return sqlite_store.load_all()
+    db = db_journal.replay(_load_from_disk_or_cloud())
+    with sqlite_store.transaction() as conn:
+        sqlite_store.replace_all(conn, db)
+    db_journal.reset()
+    logger.info("Database migrated to SQLite")
+    return db
+
+
+def _stat_version(*paths):
+    version = []
+    for path in paths:
+        try:
+            info = os.stat(path)
+            version.append((info.st_mtime_ns, info.st_size))
+        except OSError:
+            version.append(None)
+    return tuple(version)
+
+
+def _store_version():
+    """Cheap change signature of the files backing the DB."""
+    if _use_sqlite():
+        # WAL mode: commits land in the -wal file until a checkpoint
+        return _stat_version(sqlite_store.PRODUCTS_SQLITE_FILE + "-wal",
+                             sqlite_store.PRODUCTS_SQLITE_FILE)
+    return _stat_version(db_journal.PRODUCTS_DB_JOURNAL_FILE, PRODUCTS_DB_FILE)
+
+
+def _set_shared(db):
+    """Install db as the shared copy (caller holds _db_lock)."""
+    _shared["db"] = db
+    _shared["version"] = _store_version()
 
 
 def load_products_db():
-    """Load the products database using session-state cache.
-    Only reads from disk on the first call per session."""
-    if _DB_CACHE_KEY not in st.session_state:
-        st.session_state[_DB_CACHE_KEY] = _load_from_disk_or_cloud()
-    return st.session_state[_DB_CACHE_KEY]
+    """Load the products database from the process-wide cache.
+    Re-reads the store only when its files changed since the last load.
+    The returned dict is shared: treat it as read-only."""
+    with _db_lock:
+        if _shared["db"] is None or _store_version() != _shared["version"]:
+            _set_shared(_load_from_store())
+        return _shared["db"]
 
 
 def save_products_db(db):
-    """Save the products database to disk + Cloudinary, update cache."""
+    """Save the whole products database to disk, update cache and
+    schedule a Cloudinary backup."""
     db["last_updated"] = datetime.now().isoformat()
     try:
-        _write_to_disk(db)
-        upload_db_to_cloudinary(db)
-        # Update the in-memory cache
-        st.session_state[_DB_CACHE_KEY] = db
+        with _db_lock:
+            if _use_sqlite():
+                with sqlite_store.transaction() as conn:
+                    sqlite_store.replace_all(conn, db)
+            else:
+                _write_to_disk(db)
+                db_journal.reset()
+            # Update the in-memory cache
+            _set_shared(db)
+        schedule_db_backup()
+    except Exception as e:
+        logger.error(f"Failed to save products database: {e}")
+        st.error(f"Failed to save products database: {e}")
+
+
+def _record_change(op, *args):
+    """Apply one typed change (see db_journal.OPS) to the cached db and
+    persist just that change: a row-level SQLite write, or a journal
+    append for the JSON backend."""
+    try:
+        with _db_lock:
+            db = dict(load_products_db())
+            db_journal.apply(db, op, *args)
+            db["last_updated"] = datetime.now().isoformat()
+            if _use_sqlite():
+                with sqlite_store.transaction() as conn:
+                    getattr(sqlite_store, op)(conn, *args)
+                    sqlite_store.set_meta(conn, "last_updated", db["last_updated"])
+            else:
+                length = db_journal.append(op, *args)
+                db_journal.maybe_compact(length, get_empty_products_db)
+            _set_shared(db)
+        schedule_db_backup()
     except Exception as e:
         logger.error(f"Failed to save products database: {e}")
         st.error(f"Failed to save products database: {e}")
@@ -103,8 +218,8 @@ def save_products_db(db):
 
 def invalidate_db_cache():
     """Force reload from disk on next access."""
-    if _DB_CACHE_KEY in st.session_state:
-        del st.session_state[_DB_CACHE_KEY]
+    with _db_lock:
+        _shared["db"] = None
 
 
 # =========================================================================
@@ -113,24 +228,20 @@ def invalidate_db_cache():
 
 def save_product_override(product_id, field_changes):
     """Save field-level overrides for a product."""
-    db = load_products_db()
-    if product_id not in db["product_overrides"]:
-        db["product_overrides"][product_id] = {}
-    db["product_overrides"][product_id].update(field_changes)
-    save_products_db(db)
+    _record_change("set_overrides", product_id, field_changes)
+
+
+def save_product_overrides_bulk(changes):
+    """Save field-level overrides for many products with a single persist.
+    changes: {product_id: {field: value}}."""
+    changes = {pid: delta for pid, delta in changes.items() if delta}
+    if changes:
+        _record_change("set_overrides_bulk", changes)
 
 
 def remove_product_override(product_id, field_name=None):
     """Remove override for a product (or a specific field)."""
-    db = load_products_db()
-    if product_id in db["product_overrides"]:
-        if field_name:
-            db["product_overrides"][product_id].pop(field_name, None)
-            if not db["product_overrides"][product_id]:
-                del db["product_overrides"][product_id]
-        else:
-            del db["product_overrides"][product_id]
-    save_products_db(db)
+    _record_change("remove_override", product_id, field_name)
 
 
 # =========================================================================
@@ -139,17 +250,12 @@ def remove_product_override(product_id, field_name=None):
 
 def mark_product_deleted(product_id):
     """Mark an Excel product as hidden/deleted."""
-    db = load_products_db()
-    if product_id not in db["deleted_products"]:
-        db["deleted_products"].append(product_id)
-    save_products_db(db)
+    _record_change("add_deleted", product_id)
 
 
 def unmark_product_deleted(product_id):
     """Restore a previously hidden product."""
-    db = load_products_db()
-    db["deleted_products"] = [pid for pid in db["deleted_products"] if pid != product_id]
-    save_products_db(db)
+    _record_change("remove_deleted", product_id)
 
 
 # =========================================================================
@@ -158,18 +264,12 @@ def unmark_product_deleted(product_id):
 
 def add_custom_product_to_db(product_data):
     """Add a custom product to the database."""
-    db = load_products_db()
-    db["custom_products"].append(product_data)
-    save_products_db(db)
+    _record_change("add_custom", product_data)
 
 
 def delete_custom_product_from_db(product_id):
     """Remove a custom product from the database."""
-    db = load_products_db()
-    db["custom_products"] = [
-        p for p in db["custom_products"] if p.get("ProductID") != product_id
-    ]
-    save_products_db(db)
+    _record_change("delete_custom", product_id)
 
 
 def get_custom_products_from_db():
@@ -212,14 +312,24 @@ def delete_custom_item(pid):
 # =========================================================================
 
 def save_cart_to_db(cart_items):
-    """Persist cart to the JSON database."""
-    db = load_products_db()
-    db["saved_cart"] = cart_items
-    save_products_db(db)
+    """Persist the whole cart to the products database."""
+    _record_change("replace_cart", cart_items)
+
+
+def add_cart_items_to_db(cart_items):
+    """Persist items appended to the cart (only those rows are written)."""
+    if cart_items:
+        _record_change("add_cart_items", list(cart_items))
+
+
+def remove_cart_items_from_db(product_ids):
+    """Persist the removal of cart items by ProductID."""
+    if product_ids:
+        _record_change("remove_cart_items", list(product_ids))
 
 
 def load_cart_from_db():
-    """Load persisted cart from the JSON database."""
+    """Load persisted cart from the products database."""
     db = load_products_db()
     return db.get("saved_cart", [])
 
@@ -227,9 +337,74 @@ def load_cart_from_db():
 # =========================================================================
 # Template Management
 # =========================================================================
+# A template is stored as a small record: metadata plus its cart entries
+# (ProductID references, see cart.cart_entries) as zlib-compressed JSON:
+#   {"format": 2, "count": n, "updated_at": iso, "items_z": "<b64 zlib>"}
+# Legacy templates (a plain list of item dicts) are still read. SQLite
+# keeps one row per template, the JSON backend one file per template in
+# TEMPLATE_RECORDS_DIR; either way only the changed template is written. Records
+# are cached in memory and re-read only when a stat() shows a change.
+
+TEMPLATE_FORMAT = 2
+_templates_cache = {"version": None, "records": None}
+
+
+def _encode_template(items):
+    raw = json.dumps(items, separators=(",", ":"), default=str).encode()
+    return {
+        "format": TEMPLATE_FORMAT,
+        "count": len(items),
+        "updated_at": datetime.now().isoformat(),
+        "items_z": base64.b64encode(zlib.compress(raw)).decode(),
+    }
+
+
+def _as_record(value):
+    """Accept a stored record or a legacy item list."""
+    return value if isinstance(value, dict) else _encode_template(value)
+
+
+def _decode_template(record):
+    """Cart items of a stored template (legacy lists are returned as-is)."""
+    if isinstance(record, list):
+        return record
+    return json.loads(zlib.decompress(base64.b64decode(record["items_z"])))
+
+
+def _template_path(name):
+    digest = hashlib.sha1(name.encode()).hexdigest()
+    return os.path.join(TEMPLATE_RECORDS_DIR, f"{digest}.json")
+
+
+def _write_template_file(name, record):
+    os.makedirs(TEMPLATE_RECORDS_DIR, exist_ok=True)
+    path = _template_path(name)
+    with open(path + ".tmp", 'w') as f:
+        json.dump({"name": name, **record}, f)
+    os.replace(path + ".tmp", path)
 
-def load_saved_templates():
-    """Load saved cart templates from disk or Cloudinary."""
+
+def _read_template_files():
+    records = {}
+    for entry in os.scandir(TEMPLATE_RECORDS_DIR):
+        if not entry.name.endswith(".json"):
+            continue
+        try:
+            with open(entry.path, 'r') as f:
+                record = json.load(f)
+            records[record.pop("name")] = record
+        except (json.JSONDecodeError, OSError, KeyError) as e:
+            logger.warning(f"Skipping unreadable template {entry.name}: {e}")
+    return _by_name(records)
+
+
+def _by_name(records):
+    """Templates ordered by name, case-insensitively (both backends)."""
+    return dict(sorted(records.items(), key=lambda kv: kv[0].lower()))
+
+
+def _load_templates_from_disk_or_cloud():
+    """Load legacy saved_templates.json, falling back to the Cloudinary backup."""
     if os.path.exists(SAVED_TEMPLATES_FILE):
         try:
             with open(SAVED_TEMPLATES_FILE, 'r') as f:
@@ -239,23 +414,79 @@ def load_saved_templates():
 
     cloud_templates = download_templates_from_cloudinary()
     if cloud_templates:
-        try:
-            with open(SAVED_TEMPLATES_FILE, 'w') as f:
-                json.dump(cloud_templates, f, indent=4)
-        except OSError:
-            pass
         return cloud_templates
     return {}
 
 
+def _ensure_templates_migrated():
+    """One-time import of legacy/Cloudinary templates into the store."""
+    if _use_sqlite():
+        if sqlite_store.is_initialized("templates_initialized"):
+            return
+        templates = _load_templates_from_disk_or_cloud()
+        with sqlite_store.transaction() as conn:
+            for name, items in templates.items():
+                sqlite_store.save_template(conn, name, _as_record(items))
+            sqlite_store.set_meta(conn, "templates_initialized", "1")
+    elif not os.path.isdir(TEMPLATE_RECORDS_DIR):
+        templates = _load_templates_from_disk_or_cloud()
+        os.makedirs(TEMPLATE_RECORDS_DIR, exist_ok=True)
+        for name, items in templates.items():
+            _write_template_file(name, _as_record(items))
+
+
+def _templates_version():
+    if _use_sqlite():
+        # Template-only counter, so cart and product writes don't
+        # invalidate the template cache
+        return sqlite_store.templates_version()
+    return _stat_version(TEMPLATE_RECORDS_DIR)
+
+
+def _template_records():
+    """{name: record} from the in-memory cache, re-read on change."""
+    with _db_lock:
+        if (_templates_cache["records"] is None
+                or _templates_version() != _templates_cache["version"]):
+            _ensure_templates_migrated()
+            records = (
+                sqlite_store.load_templates() if _use_sqlite()
+                else _read_template_files()
+            )
+            _templates_cache["records"] = records
+            _templates_cache["version"] = _templates_version()
+        return _templates_cache["records"]
+
+
+def list_saved_templates():
+    """{name: item count} for every saved template (nothing is decoded)."""
+    return {
+        name: len(record) if isinstance(record, list) else record["count"]
+        for name, record in _template_records().items()
+    }
+
+
+def load_template(name):
+    """Cart entries of a saved template ([] if it does not exist)."""
+    record = _template_records().get(name)
+    return _decode_template(record) if record is not None else []
+
+
 def save_template_to_disk(name, cart_items):
-    """Save a named template and backup to Cloudinary."""
-    templates = load_saved_templates()
-    templates[name] = cart_items
+    """Save a named template and schedule a Cloudinary backup."""
+    record = _encode_template(cart_items)
     try:
-        with open(SAVED_TEMPLATES_FILE, 'w') as f:
-            json.dump(templates, f, indent=4)
-        upload_templates_to_cloudinary()
+        with _db_lock:
+            records = dict(_template_records())
+            if _use_sqlite():
+                with sqlite_store.transaction() as conn:
+                    sqlite_store.save_template(conn, name, record)
+            else:
+                _write_template_file(name, record)
+            records[name] = record
+            _templates_cache["records"] = _by_name(records)
+            _templates_cache["version"] = _templates_version()
+        schedule_templates_backup()
         st.toast(f"Template '{name}' saved!", icon="\U0001f4be")
     except Exception as e:
         logger.error(f"Failed to save template: {e}")
@@ -264,16 +495,22 @@ def save_template_to_disk(name, cart_items):
 
 def delete_template(name):
     """Delete a saved template by name."""
-    templates = load_saved_templates()
-    if name in templates:
-        del templates[name]
-        try:
-            with open(SAVED_TEMPLATES_FILE, 'w') as f:
-                json.dump(templates, f, indent=4)
-            upload_templates_to_cloudinary()
-            st.toast(f"Template '{name}' deleted!", icon="\U0001f5d1\ufe0f")
-        except Exception as e:
-            logger.error(f"Failed to delete template: {e}")
+    try:
+        with _db_lock:
+            records = dict(_template_records())
+            if records.pop(name, None) is None:
+                return
+            if _use_sqlite():
+                with sqlite_store.transaction() as conn:
+                    sqlite_store.delete_template(conn, name)
+            elif os.path.exists(_template_path(name)):
+                os.remove(_template_path(name))
+            _templates_cache["records"] = records
+            _templates_cache["version"] = _templates_version()
+        schedule_templates_backup()
+        st.toast(f"Template '{name}' deleted!", icon="\U0001f5d1\ufe0f")
+    except Exception as e:
+        logger.error(f"Failed to delete template: {e}")
 
 
 # =========================================================================
@@ -284,7 +521,7 @@ def migrate_old_custom_items():
     """One-time migration from old custom_products.json to new products_db.json."""
     if not os.path.exists(CUSTOM_ITEMS_FILE):
         return False
-    db = load_products_db()
+    db = dict(load_products_db())
     if db["custom_products"]:
         return False
     try:
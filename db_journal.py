@@ -0,0 +1,215 @@
+"""
+HEM Product Catalogue - Products DB Change Journal
+Append-only log of typed change records for the JSON storage backend.
+
+Each mutation is one JSON line ({"ts", "op", "args"}) appended to the
+journal instead of a full rewrite of products_db.json. Loading reads the
+JSON snapshot and replays the journal on top; every JOURNAL_COMPACT_EVERY
+records the journal is folded into a fresh snapshot and truncated.
+
+All ops are idempotent, so replaying records that already made it into
+the snapshot (a crash between snapshot write and truncate) is harmless,
+and a torn last line from a crash mid-append is skipped.
+"""
+import os
+import json
+import logging
+import threading
+from datetime import datetime
+
+from config import PRODUCTS_DB_FILE, PRODUCTS_DB_JOURNAL_FILE, JOURNAL_COMPACT_EVERY
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.RLock()
+_count = None   # records in the journal; counted lazily
+
+
+# =========================================================================
+# Change Operations (applied to the in-memory JSON document)
+# =========================================================================
+
+# Ops never mutate a nested container in place: they rebind the top-level
+# key to an updated copy, so readers holding the previous db (other
+# sessions sharing the process-wide cache) always see a consistent view.
+
+def _set_overrides(db, product_id, field_changes):
+    _set_overrides_bulk(db, {product_id: field_changes})
+
+
+def _set_overrides_bulk(db, changes):
+    overrides = dict(db["product_overrides"])
+    for product_id, field_changes in changes.items():
+        overrides[product_id] = {**overrides.get(product_id, {}), **field_changes}
+    db["product_overrides"] = overrides
+
+
+def _remove_override(db, product_id, field_name=None):
+    if product_id not in db["product_overrides"]:
+        return
+    overrides = dict(db["product_overrides"])
+    if field_name:
+        fields = {k: v for k, v in overrides[product_id].items() if k != field_name}
+        if fields:
+            overrides[product_id] = fields
+        else:
+            del overrides[product_id]
+    else:
+        del overrides[product_id]
+    db["product_overrides"] = overrides
+
+
+def _add_deleted(db, product_id):
+    if product_id not in db["deleted_products"]:
+        db["deleted_products"] = db["deleted_products"] + [product_id]
+
+
+def _remove_deleted(db, product_id):
+    db["deleted_products"] = [
+        pid for pid in db["deleted_products"] if pid != product_id
+    ]
+
+
+def _add_custom(db, product):
+    pid = product.get("ProductID")
+    if not any(p.get("ProductID") == pid for p in db["custom_products"]):
+        db["custom_products"] = db["custom_products"] + [product]
+
+
+def _delete_custom(db, product_id):
+    db["custom_products"] = [
+        p for p in db["custom_products"] if p.get("ProductID") != product_id
+    ]
+
+
+def _replace_cart(db, items):
+    db["saved_cart"] = list(items)
+
+
+def _add_cart_items(db, items):
+    present = {item.get("ProductID") for item in db["saved_cart"]}
+    new_items = [item for item in items if item.get("ProductID") not in present]
+    if new_items:
+        db["saved_cart"] = db["saved_cart"] + new_items
+
+
+def _remove_cart_items(db, product_ids):
+    product_ids = set(product_ids)
+    db["saved_cart"] = [
+        item for item in db["saved_cart"]
+        if item.get("ProductID") not in product_ids
+    ]
+
+
+OPS = {
+    "set_overrides":  _set_overrides,
+    "set_overrides_bulk": _set_overrides_bulk,
+    "remove_override": _remove_override,
+    "add_deleted":    _add_deleted,
+    "remove_deleted": _remove_deleted,
+    "add_custom":     _add_custom,
+    "delete_custom":  _delete_custom,
+    "replace_cart":   _replace_cart,
+    "add_cart_items": _add_cart_items,
+    "remove_cart_items": _remove_cart_items,
+}
+
+
+def apply(db, op, *args):
+    """Apply one change record to a db dict in place."""
+    OPS[op](db, *args)
+
+
+# =========================================================================
+# Journal File
+# =========================================================================
+
+def _read_records():
+    if not os.path.exists(PRODUCTS_DB_JOURNAL_FILE):
+        return []
+    records = []
+    with open(PRODUCTS_DB_JOURNAL_FILE, 'r') as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                logger.warning("Skipping torn journal record")
+    return records
+
+
+def append(op, *args):
+    """Durably append a change record. Returns the journal length."""
+    global _count
+    record = {"ts": datetime.now().isoformat(), "op": op, "args": list(args)}
+    line = (json.dumps(record, default=str) + "\n").encode()
+    with _lock:
+        if _count is None:
+            _count = len(_read_records())
+        os.makedirs(os.path.dirname(PRODUCTS_DB_JOURNAL_FILE), exist_ok=True)
+        with open(PRODUCTS_DB_JOURNAL_FILE, 'ab+') as f:
+            # Terminate a torn record left by a crash so it can't swallow ours
+            if f.seek(0, os.SEEK_END):
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b"\n":
+                    line = b"\n" + line
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+        _count += 1
+        return _count
+
+
+def replay(db):
+    """Apply every journalled change to db in place; returns db."""
+    with _lock:
+        records = _read_records()
+    for rec in records:
+        try:
+            apply(db, rec["op"], *rec.get("args", []))
+        except (KeyError, TypeError) as e:
+            logger.warning(f"Skipping invalid journal record {rec!r}: {e}")
+        else:
+            db["last_updated"] = rec.get("ts", db.get("last_updated"))
+    return db
+
+
+def reset():
+    """Truncate the journal (the snapshot now holds every change)."""
+    global _count
+    with _lock:
+        if os.path.exists(PRODUCTS_DB_JOURNAL_FILE):
+            os.remove(PRODUCTS_DB_JOURNAL_FILE)
+        _count = 0
+
+
+def write_snapshot(db):
+    """Atomically write db as the products_db.json snapshot."""
+    os.makedirs(os.path.dirname(PRODUCTS_DB_FILE), exist_ok=True)
+    temp_path = PRODUCTS_DB_FILE + ".tmp"
+    with open(temp_path, 'w') as f:
+        json.dump(db, f, indent=2)
+    os.replace(temp_path, PRODUCTS_DB_FILE)
+
+
+def read_snapshot(default):
+    """Return the on-disk snapshot, or default() if it is missing."""
+    if not os.path.exists(PRODUCTS_DB_FILE):
+        return default()
+    with open(PRODUCTS_DB_FILE, 'r') as f:
+        return json.load(f)
+
+
+def compact(default):
+    """Fold the journal into the snapshot and truncate it.
+    Works from disk, not a caller's cached copy, so changes journalled
+    by other sessions are never dropped."""
+    with _lock:
+        db = replay(read_snapshot(default))
+        write_snapshot(db)
+        reset()
+    logger.info("Products DB journal compacted")
+
+
+def maybe_compact(length, default):
+    if length >= JOURNAL_COMPACT_EVERY:
+        compact(default)
@@ -0,0 +1,123 @@
+"""
+HEM Product Catalogue - Image Cache Module
+Persistent, content-addressed on-disk cache for transcoded product images.
+
+Entries are keyed by the full Cloudinary delivery URL (which embeds the
+public_id, version and transformation) plus the local resize options, so
+a re-uploaded image gets a new key and stale entries simply age out.
+Eviction is LRU by file access time, bounded by IMAGE_CACHE_MAX_MB.
+"""
+import os
+import base64
+import hashlib
+import logging
+import threading
+
+from config import IMAGE_CACHE_DIR, IMAGE_CACHE_MAX_MB
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_total_bytes = None  # lazily computed on first write
+
+
+def make_key(url, resize=None, max_size=None):
+    """Build a stable cache key for a URL + transcode options."""
+    raw = f"{url}|{resize}|{max_size}"
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def _entry_path(key):
+    return os.path.join(IMAGE_CACHE_DIR, key[:2], f"{key}.jpg")
+
+
+def get_bytes(key):
+    """Return the cached JPEG bytes, or None on a miss."""
+    path = _entry_path(key)
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+        os.utime(path)  # mark as recently used for LRU eviction
+        return data
+    except OSError:
+        return None
+
+
+def get(key):
+    """Return the cached image as a base64 string, or None on a miss."""
+    data = get_bytes(key)
+    return base64.b64encode(data).decode() if data else None
+
+
+def put(key, jpeg_bytes):
+    """Store JPEG bytes under key and evict old entries if over budget."""
+    global _total_bytes
+    path = _entry_path(key)
+    try:
+        old_size = os.path.getsize(path)   # overwriting an existing entry
+    except OSError:
+        old_size = 0
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(jpeg_bytes)
+        os.replace(temp_path, path)
+    except OSError as e:
+        logger.warning(f"Image cache write failed: {e}")
+        return
+    with _lock:
+        if _total_bytes is None:
+            _total_bytes = sum(size for _, size, _ in _scan())
+        else:
+            _total_bytes += len(jpeg_bytes) - old_size
+        if _total_bytes > IMAGE_CACHE_MAX_MB * 1024 * 1024:
+            _evict()
+
+
+def _scan():
+    """Yield (path, size, atime) for every cached entry."""
+    if not os.path.isdir(IMAGE_CACHE_DIR):
+        return
+    for root, _, files in os.walk(IMAGE_CACHE_DIR):
+        for name in files:
+            if not name.endswith(".jpg"):
+                continue
+            path = os.path.join(root, name)
+            try:
+                info = os.stat(path)
+            except OSError:
+                continue
+            yield path, info.st_size, max(info.st_atime, info.st_mtime)
+
+
+def _evict():
+    """Remove least-recently-used entries down to 90% of the budget.
+    Caller must hold _lock."""
+    global _total_bytes
+    entries = sorted(_scan(), key=lambda e: e[2])
+    _total_bytes = sum(size for _, size, _ in entries)
+    target = IMAGE_CACHE_MAX_MB * 1024 * 1024 * 0.9
+    removed = 0
+    for path, size, _ in entries:
+        if _total_bytes <= target:
+            break
+        try:
+            os.remove(path)
+            _total_bytes -= size
+            removed += 1
+        except OSError:
+            pass
+    logger.info(f"Image cache evicted {removed} entries")
+
+
+def clear():
+    """Delete every cached image."""
+    global _total_bytes
+    with _lock:
+        for path, _, _ in list(_scan()):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        _total_bytes = 0
@@ -0,0 +1,128 @@
+"""
+HEM Product Catalogue - Image Matcher Module
+Prebuilt index that maps products to Cloudinary image URLs.
+
+Match priority (unchanged from the original linear scan):
+  1. Exact Path      – catalogue + category + item == full public_id key
+  2. Category Path   – category + item == full public_id key
+  3. Exact Filename  – item == file-name key
+  4. Partial         – first file-name key (in Cloudinary listing order,
+                       keys shorter than 4 chars ignored) where either
+                       the item starts with the key or the key starts
+                       with the item.
+
+The partial step is answered with a sorted key array (bisect) plus a
+range-minimum table over listing order, so each lookup is logarithmic
+instead of a scan over every file name.
+"""
+from bisect import bisect_left
+
+MIN_PARTIAL_KEY_LEN = 4
+
+
+def clean_key(text):
+    """Normalize text for fuzzy image key matching.
+    Removes extensions, spaces, special chars, lowercases."""
+    if not isinstance(text, str):
+        return ""
+    text = text.lower().strip()
+    for ext in ['.jpg', '.jpeg', '.png', '.webp', '.bmp', '.tiff']:
+        if text.endswith(ext):
+            text = text[:-len(ext)]
+    text = (text
+            .replace('\u00a0', '')
+            .replace(' ', '')
+            .replace('_', '')
+            .replace('-', '')
+            .replace('/', '')
+            .replace('\\', '')
+            .replace('.', ''))
+    return text
+
+
+class ImageMatcher:
+    """Index over Cloudinary resources answering product → image lookups."""
+
+    def __init__(self, resources=()):
+        self.path_map = {}       # clean(public_id)  → url
+        self.filename_map = {}   # clean(file name)  → url (first wins)
+        for res in resources:
+            public_id = res['public_id']
+            url = res['secure_url']
+            self.path_map[clean_key(public_id)] = url
+            file_key = clean_key(public_id.split('/')[-1])
+            if file_key not in self.filename_map:
+                self.filename_map[file_key] = url
+        self._build_prefix_index()
+
+    def __len__(self):
+        return len(self.path_map)
+
+    def _build_prefix_index(self):
+        """Sort partial-match keys and build a sparse table of listing order."""
+        # Listing order of each eligible key (dicts preserve insertion order)
+        self._order = {
+            k: i for i, k in enumerate(self.filename_map)
+            if len(k) >= MIN_PARTIAL_KEY_LEN
+        }
+        self._sorted_keys = sorted(self._order)
+        # _sparse[j][i] = min listing order in _sorted_keys[i : i + 2**j]
+        level = [self._order[k] for k in self._sorted_keys]
+        self._sparse = [level]
+        width = 1
+        while width * 2 <= len(level):
+            prev = self._sparse[-1]
+            self._sparse.append([
+                min(prev[i], prev[i + width])
+                for i in range(len(prev) - width)
+            ])
+            width *= 2
+        self._keys_by_order = {i: k for k, i in self._order.items()}
+
+    def _range_min(self, lo, hi):
+        """Minimum listing order among _sorted_keys[lo:hi] (hi > lo)."""
+        j = (hi - lo).bit_length() - 1
+        row = self._sparse[j]
+        return min(row[lo], row[hi - (1 << j)])
+
+    def _partial_match(self, item):
+        """Return the first key (by listing order) related to item by prefix."""
+        best = None
+        # Keys that are a prefix of item: only len(item) candidates exist
+        for n in range(MIN_PARTIAL_KEY_LEN, len(item) + 1):
+            order = self._order.get(item[:n])
+            if order is not None and (best is None or order < best):
+                best = order
+        # Keys that start with item: a contiguous range of the sorted array
+        lo = bisect_left(self._sorted_keys, item)
+        hi = bisect_left(self._sorted_keys, item + '\uffff', lo)
+        if hi > lo:
+            order = self._range_min(lo, hi)
+            if best is None or order < best:
+                best = order
+        if best is None:
+            return None
+        return self._keys_by_order[best]
+
+    def match(self, catalogue, category, item_name):
+        """Find the image URL for a product.
+        Returns (url or None, match_type string)."""
+        cat = clean_key(str(catalogue))
+        category = clean_key(str(category))
+        item = clean_key(str(item_name))
+
+        key_1 = cat + category + item
+        key_2 = category + item
+        if key_1 in self.path_map:
+            return self.path_map[key_1], "Exact Path"
+        if key_2 in self.path_map:
+            return self.path_map[key_2], "Category Path"
+        if item in self.filename_map:
+            return self.filename_map[item], "Exact Filename"
+
+        c_key = self._partial_match(item)
+        if c_key is None:
+            return None, "None"
+        if item.startswith(c_key):
+            return self.filename_map[c_key], f"Partial: Item starts with '{c_key}'"
+        return self.filename_map[c_key], f"Partial: File starts with '{item}'"
@@ -0,0 +1,238 @@
+"""
+HEM Product Catalogue - Image Store Module
+Lightweight image handles in place of inline base64 data.
+
+Product rows, cart items, saved carts and templates carry a short handle
+string instead of a full base64 JPEG:
+
+    img:<id>:<mime>:<width>x<height>
+
+The id is the on-disk image cache key, so the bytes live in the image
+cache and are only materialized when a thumbnail, PDF or export needs
+them. Consumers ask for a named variant (see IMAGE_VARIANTS); smaller
+variants are downscaled from the stored image once and cached on disk
+under their own key. A small registry (id → source URL + transcode
+options) lets evicted images be re-fetched transparently.
+"""
+import io
+import os
+import json
+import base64
+import logging
+import threading
+from collections import OrderedDict
+
+from PIL import Image
+
+import image_cache
+from cloudinary_client import get_image_jpeg_bytes, fetch_images_parallel
+from config import IMAGE_STORE_INDEX_FILE, IMAGE_VARIANTS
+
+logger = logging.getLogger(__name__)
+
+HANDLE_PREFIX = "img:"
+DEFAULT_VARIANT = "print"
+
+_lock = threading.Lock()
+_registry = None   # id → {"url", "resize", "max_size"}; loaded lazily
+_dirty = False
+_b64_memo = OrderedDict()   # (id, variant) → base64, small LRU
+_B64_MEMO_SIZE = 512
+
+
+# =========================================================================
+# Handle Encoding
+# =========================================================================
+
+def is_handle(value):
+    """True if value is an image handle string."""
+    return isinstance(value, str) and value.startswith(HANDLE_PREFIX)
+
+
+def make_handle(image_id, mime, width, height):
+    return f"{HANDLE_PREFIX}{image_id}:{mime}:{width}x{height}"
+
+
+def parse_handle(handle):
+    """Return {"id", "mime", "width", "height"} for a handle, or None."""
+    if not is_handle(handle):
+        return None
+    try:
+        image_id, mime, dims = handle[len(HANDLE_PREFIX):].split(":")
+        width, height = (int(v) for v in dims.split("x"))
+    except ValueError:
+        return None
+    return {"id": image_id, "mime": mime, "width": width, "height": height}
+
+
+# =========================================================================
+# Registry (source of each image, for re-fetch after cache eviction)
+# =========================================================================
+
+def _load_registry():
+    global _registry
+    if _registry is None:
+        _registry = {}
+        if os.path.exists(IMAGE_STORE_INDEX_FILE):
+            try:
+                with open(IMAGE_STORE_INDEX_FILE, 'r') as f:
+                    _registry = json.load(f)
+            except (json.JSONDecodeError, OSError) as e:
+                logger.warning(f"Failed to load image store index: {e}")
+    return _registry
+
+
+def save_registry():
+    """Persist the registry if new images were registered."""
+    global _dirty
+    with _lock:
+        if not _dirty:
+            return
+        try:
+            os.makedirs(os.path.dirname(IMAGE_STORE_INDEX_FILE), exist_ok=True)
+            with open(IMAGE_STORE_INDEX_FILE, 'w') as f:
+                json.dump(_registry, f)
+            _dirty = False
+        except OSError as e:
+            logger.warning(f"Failed to save image store index: {e}")
+
+
+# =========================================================================
+# Register / Materialize
+# =========================================================================
+
+def register(url, resize=None, max_size=None):
+    """Make sure the image at url is in the store and return its handle
+    ("" if it could not be fetched)."""
+    global _dirty
+    if not url:
+        return ""
+    jpeg_bytes = get_image_jpeg_bytes(url, resize=resize, max_size=max_size)
+    if not jpeg_bytes:
+        return ""
+    image_id = image_cache.make_key(url, resize, max_size)
+    try:
+        width, height = Image.open(io.BytesIO(jpeg_bytes)).size
+    except Exception:
+        width, height = 0, 0
+    with _lock:
+        registry = _load_registry()
+        if image_id not in registry:
+            registry[image_id] = {
+                "url": url,
+                "resize": list(resize) if resize else None,
+                "max_size": list(max_size) if max_size else None,
+            }
+            _dirty = True
+    return make_handle(image_id, "image/jpeg", width, height)
+
+
+def register_many(urls, max_workers=None):
+    """Register many URLs concurrently. Returns {url: handle}."""
+    handles = fetch_images_parallel(urls, max_workers=max_workers, loader=register)
+    save_registry()
+    return handles
+
+
+def _load_source_bytes(image_id):
+    """JPEG bytes of the stored image, re-fetching it if evicted."""
+    data = image_cache.get_bytes(image_id)
+    if data:
+        return data
+    with _lock:
+        source = _load_registry().get(image_id)
+    if not source:
+        return b""
+    return get_image_jpeg_bytes(
+        source["url"],
+        resize=tuple(source["resize"]) if source.get("resize") else None,
+        max_size=tuple(source["max_size"]) if source.get("max_size") else None,
+    )
+
+
+def _downscale(jpeg_bytes, max_px):
+    """Shrink JPEG bytes so the longest side is at most max_px."""
+    img = Image.open(io.BytesIO(jpeg_bytes))
+    if max(img.size) <= max_px:
+        return jpeg_bytes
+    img.thumbnail((max_px, max_px))
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    buffered = io.BytesIO()
+    img.save(buffered, format="JPEG", quality=85)
+    return buffered.getvalue()
+
+
+def _load_variant_bytes(image_id, variant):
+    if variant == DEFAULT_VARIANT:
+        return _load_source_bytes(image_id)
+    variant_key = image_cache.make_key(image_id, variant)
+    data = image_cache.get_bytes(variant_key)
+    if data:
+        return data
+    source = _load_source_bytes(image_id)
+    if not source:
+        return b""
+    try:
+        data = _downscale(source, IMAGE_VARIANTS[variant])
+    except Exception as e:
+        logger.warning(f"Failed to build '{variant}' variant of {image_id}: {e}")
+        return source
+    image_cache.put(variant_key, data)
+    return data
+
+
+def _load_b64(image_id, variant):
+    memo_key = (image_id, variant)
+    with _lock:
+        if memo_key in _b64_memo:
+            _b64_memo.move_to_end(memo_key)
+            return _b64_memo[memo_key]
+    data = _load_variant_bytes(image_id, variant)
+    if not data:
+        return ""
+    b64 = base64.b64encode(data).decode()
+    with _lock:
+        _b64_memo[memo_key] = b64
+        if len(_b64_memo) > _B64_MEMO_SIZE:
+            _b64_memo.popitem(last=False)
+    return b64
+
+
+def get_b64(value, variant=DEFAULT_VARIANT):
+    """Materialize any stored image value as a base64 string.
+    Accepts a handle, an http URL (legacy custom products) or raw base64
+    (legacy saved carts/templates, returned as-is for every variant)."""
+    if not value or not isinstance(value, str):
+        return ""
+    if variant not in IMAGE_VARIANTS:
+        raise ValueError(f"Unknown image variant: {variant}")
+    if is_handle(value):
+        meta = parse_handle(value)
+        return _load_b64(meta["id"], variant) if meta else ""
+    if value.startswith("http"):
+        handle = register(value)
+        save_registry()
+        return get_b64(handle, variant)
+    return value
+
+
+def get_mime(value):
+    """MIME type for a stored image value."""
+    meta = parse_handle(value)
+    if meta:
+        return meta["mime"]
+    return "image/png" if "png" in str(value)[:30].lower() else "image/jpeg"
+
+
+def to_data_uri(value, variant=DEFAULT_VARIANT):
+    """Return a data: URI for a stored image value, or "" if unavailable."""
+    b64 = get_b64(value, variant)
+    return f"data:{get_mime(value)};base64,{b64}" if b64 else ""
+
+
+def has_image(value):
+    """Cheap check that a value refers to an image (no bytes are loaded)."""
+    if is_handle(value) or str(value).startswith("http"):
+        return True
+    return bool(value) and len(str(value)) > 100
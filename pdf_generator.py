@@ -20,6 +20,7 @@ import streamlit as st
 
 from config import BASE_DIR, LOGO_PATH, STORY_IMG_1_PATH, COVER_IMAGE_URL, JOURNEY_IMAGE_URL
 from cloudinary_client import get_image_as_base64_str
+from image_store import has_image, to_data_uri
 from data_loader import create_safe_id
 
 logger = logging.getLogger(__name__)
@@ -151,12 +152,12 @@ def generate_table_of_contents_html(df_sorted: pd.DataFrame) -> str:
         for category in cat_df["Category"].unique():
             grp = cat_df[cat_df["Category"] == category]
             rep_img = ""
-            for _, row in grp.iterrows():
-                s = str(row.get("ImageB64", ""))
-                if len(s) > 100:
-                    rep_img = s
-                    break
-            bg = f"background-image:url('data:image/png;base64,{rep_img}');" if rep_img else "background-color:#1a1a2e;"
+            for image in grp["ImageB64"]:
+                if has_image(image):
+                    rep_img = to_data_uri(image, "card")
+                    if rep_img:
+                        break
+            bg = f"background-image:url('{rep_img}');" if rep_img else "background-color:#1a1a2e;"
             safe_id = create_safe_id(category)
             css += f"""
             <a href="#category-{safe_id}" class="idx-card">
@@ -339,13 +340,10 @@ h1.cat-heading + .cat-block{{page-break-before:avoid!important;}}
                 html_parts.append(f'<div class="subcat-hdr">{sub}</div>')
 
         # ── Product card ──────────────────────────────────────────────────
-        img_b64 = row.get("ImageB64", "")
-        if str(img_b64).startswith("http"):
-            img_b64 = get_image_as_base64_str(img_b64)
-        mime = "image/png" if img_b64 and "png" in str(img_b64)[:30].lower() else "image/jpeg"
+        img_src = to_data_uri(row.get("ImageB64", ""), "card")
         img_html = (
-            f'<img src="data:{mime};base64,{img_b64}" alt="img" />'
-            if img_b64
+            f'<img src="{img_src}" alt="img" />'
+            if img_src
             else '<div style="padding-top:35px;color:#3a3a5a;font-size:9px;">NO IMAGE</div>'
         )
         new_badge = (
@@ -0,0 +1,272 @@
+"""
+HEM Product Catalogue - Search Index Module
+Trigram and token indexes answering the global search bar.
+
+The index is built once per data version from the products frame. Every
+searchable field is lowercased and split into overlapping 3-character
+grams; each gram maps to the set of row positions containing it. A
+substring query is answered by intersecting the postings of its grams
+(smallest first) and confirming the few remaining candidates with a
+plain substring check, so latency follows the number of matches rather
+than the size of the catalogue. Queries shorter than a gram are answered
+from the gram vocabulary. Results keep catalogue (frame) order.
+
+Ranked search adds typo tolerance on top. Words of every ranked field
+form a token dictionary (token → {row: field weight}); each query word
+is looked up exactly, as a prefix (bisect over the sorted vocabulary),
+and fuzzily against whole tokens and their leading part: padded bigrams
+of the vocabulary prune candidates with the q-gram count filter before
+a bounded edit distance confirms them. Only the rows of matched tokens
+are scored, never the whole frame.
+"""
+import re
+import threading
+from bisect import bisect_left
+from collections import Counter, OrderedDict
+
+SEARCH_FIELDS = ("ItemName", "Fragrance", "SKU Code")
+GRAM = 3
+
+# Ranked search: field → weight of a token match in that field
+RANK_FIELD_WEIGHTS = {
+    "SKU Code":    4.0,
+    "ItemName":    3.0,
+    "Fragrance":   3.0,
+    "Category":    1.5,
+    "Subcategory": 1.0,
+}
+PHRASE_BONUS = 2.0      # whole query appears as a substring
+PREFIX_SIMILARITY = 0.8
+FIRST_LETTER_COST = 2   # extra edits scored for a typo in the first letter
+MIN_PREFIX_LEN = 2
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_SEP = "\x00"   # joins a row's fields; never part of a query
+_indexes = OrderedDict()   # data version → SearchIndex (all sessions)
+_INDEX_CACHE_SIZE = 2
+_lock = threading.Lock()
+
+
+def normalize(value):
+    """Lowercased search text for a cell ("" for missing values)."""
+    if value is None or value != value:   # None / NaN
+        return ""
+    return str(value).lower()
+
+
+def tokenize(text):
+    """Alphanumeric words of a normalized text."""
+    return _TOKEN_RE.findall(text)
+
+
+def max_typos(token):
+    """Edit distance tolerated for a query word of this length.
+    Words with digits (SKU parts, sizes) must match exactly."""
+    if len(token) <= 3 or any(c.isdigit() for c in token):
+        return 0
+    return 1 if len(token) <= 5 else 2
+
+
+def _padded_bigrams(token):
+    padded = f"^{token}$"
+    return [padded[i:i + 2] for i in range(len(padded) - 1)]
+
+
+def edit_distance(a, b, limit):
+    """Optimal-string-alignment distance between a and b (adjacent
+    transpositions count once), or limit + 1 once it must exceed limit."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    prev2 = None
+    prev = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        cur = [i] + [0] * len(b)
+        for j, cb in enumerate(b, 1):
+            cost = ca != cb
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + cost)
+            if (prev2 is not None and j > 1 and ca == b[j - 2]
+                    and a[i - 2] == cb):
+                cur[j] = min(cur[j], prev2[j - 2] + 1)
+        if min(cur) > limit:
+            return limit + 1
+        prev2, prev = prev, cur
+    return prev[-1]
+
+
+def _grams(text):
+    """Distinct grams of text; texts shorter than a gram are one gram."""
+    if len(text) < GRAM:
+        return {text} if text else set()
+    return {text[i:i + GRAM] for i in range(len(text) - GRAM + 1)}
+
+
+class SearchIndex:
+    """Trigram postings over SEARCH_FIELDS of one products frame."""
+
+    def __init__(self, frame, fields=SEARCH_FIELDS):
+        fields = [f for f in fields if f in frame.columns]
+        columns = [[normalize(v) for v in frame[f].tolist()] for f in fields]
+        self.pids = frame["ProductID"].tolist() if "ProductID" in frame.columns else []
+        self.texts = [_SEP.join(values) for values in zip(*columns)]
+        self.postings = {}   # gram → set of row positions
+        for pos, values in enumerate(zip(*columns)):
+            for text in values:
+                for gram in _grams(text):
+                    self.postings.setdefault(gram, set()).add(pos)
+        self._build_token_index(frame)
+
+    def _build_token_index(self, frame):
+        self.token_rows = {}   # token → {row position: best field weight}
+        for field, weight in RANK_FIELD_WEIGHTS.items():
+            if field not in frame.columns:
+                continue
+            for pos, value in enumerate(frame[field].tolist()):
+                for token in tokenize(normalize(value)):
+                    rows = self.token_rows.setdefault(token, {})
+                    if rows.get(pos, 0) < weight:
+                        rows[pos] = weight
+        self.vocab = sorted(self.token_rows)
+        self.vocab_grams = {}   # padded bigram → tokens containing it
+        for token in self.vocab:
+            for gram in set(_padded_bigrams(token)):
+                self.vocab_grams.setdefault(gram, []).append(token)
+
+    def __len__(self):
+        return len(self.texts)
+
+    def match_positions(self, query):
+        """Sorted frame row positions whose fields contain query."""
+        query = normalize(query).strip()
+        if not query:
+            return list(range(len(self.texts)))
+        if len(query) >= GRAM:
+            postings = sorted(
+                (self.postings.get(g, ()) for g in _grams(query)), key=len
+            )
+            if not postings[0]:
+                return []
+            candidates = set(postings[0]).intersection(*postings[1:])
+        else:
+            candidates = set()
+            for gram, positions in self.postings.items():
+                if query in gram:
+                    candidates |= positions
+        texts = self.texts
+        return sorted(pos for pos in candidates if query in texts[pos])
+
+    def _similar_tokens(self, word):
+        """{vocabulary token: similarity} for one query word."""
+        matches = {}
+        if word in self.token_rows:
+            matches[word] = 1.0
+        if len(word) >= MIN_PREFIX_LEN:
+            i = bisect_left(self.vocab, word)
+            while i < len(self.vocab) and self.vocab[i].startswith(word):
+                matches.setdefault(self.vocab[i], PREFIX_SIMILARITY)
+                i += 1
+        limit = max_typos(word)
+        if limit:
+            # q-gram count filter: one edit destroys at most three padded
+            # bigrams (a transposition), so a match shares the rest; a
+            # prefix match may also lack the word's closing bigram.
+            grams = set(_padded_bigrams(word))
+            shared = Counter()
+            for gram in grams:
+                shared.update(self.vocab_grams.get(gram, ()))
+            needed = len(grams) - 1 - 3 * limit
+            for token, count in shared.items():
+                if count < needed or token in matches:
+                    continue
+                # People rarely mistype the first letter, so a match that
+                # needs it is scored as a worse typo: "sandle" is sandal,
+                # not candle.
+                cost = FIRST_LETTER_COST if word[0] != token[0] else 0
+                distance = edit_distance(word, token, limit)
+                if distance <= limit:
+                    matches[token] = 0.7 / (distance + cost)
+                elif len(token) > len(word):
+                    # Typo in the leading part of a longer (compound) word,
+                    # e.g. "sandle" → "sandalwood"
+                    distance = edit_distance(word, token[:len(word)], limit)
+                    if distance <= limit:
+                        matches[token] = (PREFIX_SIMILARITY * 0.7
+                                          / (distance + cost))
+        return matches
+
+    def ranked_positions(self, query):
+        """Frame row positions matching query, best first.
+
+        A row must match every query word (exactly, as a prefix, or
+        within max_typos edits of a whole token or of its leading part)
+        in any ranked field; rows containing the whole query as a
+        substring always match and get PHRASE_BONUS. Ties keep catalogue
+        order."""
+        query = normalize(query).strip()
+        if not query:
+            return list(range(len(self.texts)))
+        scores = None
+        words = tokenize(query)
+        for word in words:
+            word_scores = {}
+            for token, similarity in self._similar_tokens(word).items():
+                for pos, weight in self.token_rows[token].items():
+                    score = similarity * weight
+                    if word_scores.get(pos, 0) < score:
+                        word_scores[pos] = score
+            if scores is None:
+                scores = word_scores
+            else:
+                scores = {
+                    pos: score + word_scores[pos]
+                    for pos, score in scores.items() if pos in word_scores
+                }
+            if not scores:
+                break
+        scores = scores or {}
+        for pos in self.match_positions(query):
+            scores[pos] = scores.get(pos, 0) + PHRASE_BONUS
+        return sorted(scores, key=lambda pos: (-scores[pos], pos))
+
+    def search(self, query):
+        """ProductIDs whose fields contain query, in catalogue order."""
+        return [self.pids[pos] for pos in self.match_positions(query)]
+
+
+def get_search_index(frame, version):
+    """Return the SearchIndex for a data version, building it on first use.
+    Shared by every session, like the frames in data_loader."""
+    with _lock:
+        index = _indexes.get(version)
+        if index is not None and len(index) == len(frame):
+            _indexes.move_to_end(version)
+            return index
+        index = SearchIndex(frame)
+        _indexes[version] = index
+        while len(_indexes) > _INDEX_CACHE_SIZE:
+            _indexes.popitem(last=False)
+        return index
+
+
+def _self_check():
+    """Typo cases the ranking must keep resolving to the intended stem
+    (run: python search_index.py)."""
+    import pandas as pd
+    frame = pd.DataFrame({
+        "ProductID": ["C1", "C2", "S1", "S2", "L1"],
+        "ItemName": ["Smudge Candle Rosemary", "Smudge Candle Vanilla",
+                     "Sandal King Hexa", "Sandalwood Dhoop",
+                     "Precious Lavender Hexa"],
+    })
+    index = SearchIndex(frame)
+
+    def top(query, n):
+        return [index.pids[pos] for pos in index.ranked_positions(query)[:n]]
+
+    assert set(top("sandle", 2)) == {"S1", "S2"}, top("sandle", 5)
+    assert top("lavendar", 1) == ["L1"], top("lavendar", 5)
+    assert top("candle", 2) == ["C1", "C2"], top("candle", 5)
+
+
+if __name__ == "__main__":
+    _self_check()
+    print("search_index: ok")
@@ -0,0 +1,95 @@
+"""
+HEM Product Catalogue - Catalogue Snapshot Module
+Versioned on-disk snapshot of the merged products frame for fast cold starts.
+
+The frame is stored column-wise (Parquet when pyarrow is installed, pandas
+pickle otherwise). Images are not inlined: rows carry image-store handles
+whose bytes stay in the on-disk image cache. A manifest records the
+format version and the source token the snapshot was built from, so a
+snapshot is only used while it matches.
+"""
+import os
+import json
+import logging
+from datetime import datetime
+
+import pandas as pd
+
+from config import SNAPSHOT_DIR
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FORMAT_VERSION = 2
+
+# ── Optional pyarrow import (Parquet support) ─────────────────────────────
+HAS_PARQUET = False
+try:
+    import pyarrow  # noqa: F401
+    HAS_PARQUET = True
+except Exception as e:
+    logger.info(f"pyarrow not available ({e}) — snapshots use pickle.")
+
+_MANIFEST_FILE = os.path.join(SNAPSHOT_DIR, "manifest.json")
+
+
+def _frame_path(fmt):
+    return os.path.join(SNAPSHOT_DIR, f"products.{fmt}")
+
+
+def save_snapshot(frame, token):
+    """Persist the merged frame together with its source token."""
+    try:
+        os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+        fmt = "parquet" if HAS_PARQUET else "pkl"
+        temp_path = _frame_path(fmt) + ".tmp"
+        if HAS_PARQUET:
+            frame.to_parquet(temp_path, index=False)
+        else:
+            frame.to_pickle(temp_path)
+        os.replace(temp_path, _frame_path(fmt))
+        manifest = {
+            "format_version": SNAPSHOT_FORMAT_VERSION,
+            "format": fmt,
+            "token": token,
+            "rows": len(frame),
+            "created_at": datetime.now().isoformat(),
+        }
+        with open(_MANIFEST_FILE, 'w') as f:
+            json.dump(manifest, f)
+        logger.info(f"Catalogue snapshot saved ({len(frame)} rows, {fmt})")
+    except Exception as e:
+        logger.warning(f"Failed to save catalogue snapshot: {e}")
+
+
+def load_snapshot(token):
+    """Return the snapshot frame if it was built from the same source
+    token, otherwise None."""
+    if not os.path.exists(_MANIFEST_FILE):
+        return None
+    try:
+        with open(_MANIFEST_FILE, 'r') as f:
+            manifest = json.load(f)
+        if manifest.get("format_version") != SNAPSHOT_FORMAT_VERSION:
+            return None
+        if manifest.get("token") != token:
+            logger.info("Catalogue snapshot is outdated; rebuilding")
+            return None
+        fmt = manifest["format"]
+        if fmt == "parquet":
+            if not HAS_PARQUET:
+                return None
+            frame = pd.read_parquet(_frame_path(fmt))
+        else:
+            frame = pd.read_pickle(_frame_path(fmt))
+    except Exception as e:
+        logger.warning(f"Failed to load catalogue snapshot: {e}")
+        return None
+    logger.info(f"Catalogue loaded from snapshot ({len(frame)} rows)")
+    return frame
+
+
+def clear_snapshot():
+    """Delete the snapshot so the next load rebuilds it."""
+    for path in (_MANIFEST_FILE, _frame_path("parquet"), _frame_path("pkl")):
+        if os.path.exists(path):
+            os.remove(path)
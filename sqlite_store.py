@@ -0,0 +1,317 @@
+"""
+HEM Product Catalogue - SQLite Storage Backend
+Row-level storage for overrides, hidden products, custom products, the
+saved cart and templates. Used by database.py when DB_BACKEND == "sqlite".
+
+The database runs in WAL mode so readers never block the single writer,
+and every mutation touches only the rows it changes instead of rewriting
+the whole document. The process shares one connection guarded by a lock:
+Streamlit runs scripts on short-lived threads, so per-thread connections
+would pile up without ever being closed.
+"""
+import os
+import json
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+from config import PRODUCTS_SQLITE_FILE
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.RLock()
+_conn = None
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key   TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS product_overrides (
+    product_id TEXT NOT NULL,
+    field      TEXT NOT NULL,
+    value      TEXT,
+    PRIMARY KEY (product_id, field)
+);
+CREATE TABLE IF NOT EXISTS deleted_products (
+    product_id TEXT PRIMARY KEY,
+    deleted_at TEXT
+);
+CREATE TABLE IF NOT EXISTS custom_products (
+    id         INTEGER PRIMARY KEY AUTOINCREMENT,
+    product_id TEXT,
+    data       TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_custom_products_pid ON custom_products (product_id);
+CREATE TABLE IF NOT EXISTS cart_items (
+    cart       TEXT NOT NULL,
+    position   INTEGER NOT NULL,
+    product_id TEXT,
+    data       TEXT NOT NULL,
+    PRIMARY KEY (cart, position)
+);
+CREATE INDEX IF NOT EXISTS idx_cart_items_pid ON cart_items (cart, product_id);
+CREATE TABLE IF NOT EXISTS templates (
+    name       TEXT PRIMARY KEY,
+    data       TEXT NOT NULL,
+    updated_at TEXT
+);
+"""
+
+SAVED_CART = "saved"
+
+
+# =========================================================================
+# Connection Handling
+# =========================================================================
+
+def _connect():
+    """Return the shared connection, creating the DB on first use.
+    Callers must hold _lock."""
+    global _conn
+    if _conn is None:
+        os.makedirs(os.path.dirname(PRODUCTS_SQLITE_FILE), exist_ok=True)
+        conn = sqlite3.connect(
+            PRODUCTS_SQLITE_FILE, timeout=10, check_same_thread=False
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(_SCHEMA)
+        _conn = conn
+    return _conn
+
+
+@contextmanager
+def transaction():
+    """Yield a connection inside a write transaction (commit or rollback)."""
+    with _lock:
+        conn = _connect()
+        with conn:
+            yield conn
+
+
+@contextmanager
+def _reading():
+    """Yield the shared connection for a read."""
+    with _lock:
+        yield _connect()
+
+
+def get_meta(conn, key, default=""):
+    row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else default
+
+
+def set_meta(conn, key, value):
+    conn.execute(
+        "INSERT INTO meta (key, value) VALUES (?, ?) "
+        "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+        (key, str(value)),
+    )
+
+
+def is_initialized(flag="initialized"):
+    """True once the given part of the store has been populated/migrated."""
+    with _reading() as conn:
+        return get_meta(conn, flag) == "1"
+
+
+# =========================================================================
+# Whole-Document Load / Replace
+# =========================================================================
+
+def load_all():
+    """Read the full products DB in the JSON document shape."""
+    with _reading() as conn:
+        return _load_all(conn)
+
+
+def _load_all(conn):
+    overrides = {}
+    for pid, field, value in conn.execute(
+        "SELECT product_id, field, value FROM product_overrides ORDER BY rowid"
+    ):
+        overrides.setdefault(pid, {})[field] = json.loads(value)
+    return {
+        "version": int(get_meta(conn, "version", "1") or 1),
+        "last_updated": get_meta(conn, "last_updated"),
+        "product_overrides": overrides,
+        "custom_products": [
+            json.loads(data) for (data,) in
+            conn.execute("SELECT data FROM custom_products ORDER BY id")
+        ],
+        "deleted_products": [
+            pid for (pid,) in
+            conn.execute("SELECT product_id FROM deleted_products ORDER BY rowid")
+        ],
+        "saved_cart": load_cart(conn),
+    }
+
+
+def replace_all(conn, db):
+    """Replace every product table with the contents of a JSON-shaped db."""
+    conn.execute("DELETE FROM product_overrides")
+    conn.execute("DELETE FROM deleted_products")
+    conn.execute("DELETE FROM custom_products")
+    for pid, changes in db.get("product_overrides", {}).items():
+        set_overrides(conn, pid, changes)
+    for pid in db.get("deleted_products", []):
+        add_deleted(conn, pid)
+    for product in db.get("custom_products", []):
+        add_custom(conn, product)
+    replace_cart(conn, db.get("saved_cart", []))
+    set_meta(conn, "version", db.get("version", 1))
+    set_meta(conn, "last_updated", db.get("last_updated", ""))
+    set_meta(conn, "initialized", "1")
+
+
+# =========================================================================
+# Row-Level Operations (each takes an open transaction connection)
+# =========================================================================
+
+def set_overrides(conn, product_id, field_changes):
+    set_overrides_bulk(conn, {product_id: field_changes})
+
+
+def set_overrides_bulk(conn, changes):
+    """Upsert {product_id: {field: value}} in one statement batch."""
+    conn.executemany(
+        "INSERT INTO product_overrides (product_id, field, value) VALUES (?, ?, ?) "
+        "ON CONFLICT(product_id, field) DO UPDATE SET value = excluded.value",
+        [
+            (pid, f, json.dumps(v))
+            for pid, field_changes in changes.items()
+            for f, v in field_changes.items()
+        ],
+    )
+
+
+def remove_override(conn, product_id, field_name=None):
+    if field_name:
+        conn.execute(
+            "DELETE FROM product_overrides WHERE product_id = ? AND field = ?",
+            (product_id, field_name),
+        )
+    else:
+        conn.execute(
+            "DELETE FROM product_overrides WHERE product_id = ?", (product_id,)
+        )
+
+
+def add_deleted(conn, product_id):
+    conn.execute(
+        "INSERT OR IGNORE INTO deleted_products (product_id, deleted_at) VALUES (?, ?)",
+        (product_id, datetime.now().isoformat()),
+    )
+
+
+def remove_deleted(conn, product_id):
+    conn.execute("DELETE FROM deleted_products WHERE product_id = ?", (product_id,))
+
+
+def add_custom(conn, product):
+    """Insert a custom product; like the JSON journal, a ProductID that
+    is already stored is skipped."""
+    pid = product.get("ProductID")
+    conn.execute(
+        "INSERT INTO custom_products (product_id, data) SELECT ?, ? "
+        "WHERE NOT EXISTS (SELECT 1 FROM custom_products WHERE product_id IS ?)",
+        (pid, json.dumps(product), pid),
+    )
+
+
+def delete_custom(conn, product_id):
+    conn.execute("DELETE FROM custom_products WHERE product_id = ?", (product_id,))
+
+
+def load_cart(conn=None, cart=SAVED_CART):
+    if conn is None:
+        with _reading() as conn:
+            return load_cart(conn, cart)
+    return [
+        json.loads(data) for (data,) in conn.execute(
+            "SELECT data FROM cart_items WHERE cart = ? ORDER BY position", (cart,)
+        )
+    ]
+
+
+def replace_cart(conn, items, cart=SAVED_CART):
+    conn.execute("DELETE FROM cart_items WHERE cart = ?", (cart,))
+    conn.executemany(
+        "INSERT INTO cart_items (cart, position, product_id, data) VALUES (?, ?, ?, ?)",
+        [
+            (cart, i, item.get("ProductID"), json.dumps(item, default=str))
+            for i, item in enumerate(items)
+        ],
+    )
+
+
+def add_cart_items(conn, items, cart=SAVED_CART):
+    """Append items after the last position, skipping ProductIDs that are
+    already in the cart (same rule as the JSON journal)."""
+    (position,) = conn.execute(
+        "SELECT COALESCE(MAX(position), -1) FROM cart_items WHERE cart = ?",
+        (cart,),
+    ).fetchone()
+    for item in items:
+        pid = item.get("ProductID")
+        if conn.execute(
+            "SELECT 1 FROM cart_items WHERE cart = ? AND product_id IS ?",
+            (cart, pid),
+        ).fetchone():
+            continue
+        position += 1
+        conn.execute(
+            "INSERT INTO cart_items (cart, position, product_id, data) VALUES (?, ?, ?, ?)",
+            (cart, position, pid, json.dumps(item, default=str)),
+        )
+
+
+def remove_cart_items(conn, product_ids, cart=SAVED_CART):
+    conn.executemany(
+        "DELETE FROM cart_items WHERE cart = ? AND product_id = ?",
+        [(cart, pid) for pid in product_ids],
+    )
+
+
+# =========================================================================
+# Templates
+# =========================================================================
+
+def load_templates():
+    with _reading() as conn:
+        return {
+            name: json.loads(data) for name, data in conn.execute(
+                "SELECT name, data FROM templates ORDER BY name COLLATE NOCASE"
+            )
+        }
+
+
+def templates_version():
+    """Counter bumped by every template write."""
+    with _reading() as conn:
+        return get_meta(conn, "templates_rev", "0")
+
+
+def _bump_templates_version(conn):
+    conn.execute(
+        "INSERT INTO meta (key, value) VALUES ('templates_rev', '1') "
+        "ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1"
+    )
+
+
+def save_template(conn, name, record):
+    conn.execute(
+        "INSERT INTO templates (name, data, updated_at) VALUES (?, ?, ?) "
+        "ON CONFLICT(name) DO UPDATE SET data = excluded.data, "
+        "updated_at = excluded.updated_at",
+        (name, json.dumps(record, default=str), datetime.now().isoformat()),
+    )
+    _bump_templates_version(conn)
+
+
+def delete_template(conn, name):
+    conn.execute("DELETE FROM templates WHERE name = ?", (name,))
+    _bump_templates_version(conn)
@@ -4,6 +4,23 @@ Reusable widgets: confirm dialogs, thumbnails, stats bar, section headers.
 """
 import streamlit as st
 
+from image_store import has_image, to_data_uri
+
+
+# ── Partial reruns ────────────────────────────────────────────────────────
+# A function decorated with @fragment reruns on its own when one of its
+# widgets changes, instead of rerunning all of app.py. Its arguments are
+# its data dependencies: a fragment rerun reuses the values passed by the
+# last full run, and st.rerun() inside it still reruns the whole app (used
+# after cart changes so the tab labels and sidebar catch up).
+# st.fragment needs Streamlit >= 1.37 (experimental_fragment from 1.33);
+# on older versions the decorator is a no-op.
+fragment = (
+    getattr(st, "fragment", None)
+    or getattr(st, "experimental_fragment", None)
+    or (lambda func: func)
+)
+
 
 # ── Two-step confirmation dialog ──────────────────────────────────────────
 def confirm_action(key: str, label: str, message: str, danger: bool = False) -> bool:
@@ -40,11 +57,13 @@ def confirm_action(key: str, label: str, message: str, danger: bool = False) ->
 
 
 # ── Product thumbnail ─────────────────────────────────────────────────────
-def product_thumbnail_html(image_b64: str, size: int = 38) -> str:
-    """Return an <img> or placeholder <div> for a product thumbnail."""
-    if image_b64 and len(str(image_b64)) > 100:
+def product_thumbnail_html(image: str, size: int = 38) -> str:
+    """Return an <img> or placeholder <div> for a product thumbnail.
+    image may be an image handle, URL or legacy base64 string."""
+    src = to_data_uri(image, "thumb") if has_image(image) else ""
+    if src:
         return (
-            f'<img src="data:image/jpeg;base64,{image_b64}" '
+            f'<img src="{src}" '
             f'class="product-thumb" '
             f'style="width:{size}px;height:{size}px;object-fit:cover;" />'
         )
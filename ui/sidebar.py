@@ -2,15 +2,18 @@
 HEM Product Catalogue v3 — Sidebar
 Renders: logo, template save/load/delete, data sync, database info.
 """
-import time
 import streamlit as st
 
 from database import (
-    load_saved_templates, save_template_to_disk, delete_template,
+    list_saved_templates, load_template, save_template_to_disk, delete_template,
     load_products_db,
 )
-from cart import clear_cart
-from cloudinary_client import fetch_all_cloudinary_resources
+from cart import clear_cart, set_cart, cart_items, cart_entries
+from cloudinary_client import (
+    fetch_all_cloudinary_resources, cloudinary_status, set_offline_mode,
+)
+from data_loader import reset_sync_state, is_snapshot_stale, invalidate_data
+from backup_worker import backup_status
 
 
 def render_sidebar() -> None:
@@ -37,7 +40,7 @@ def render_sidebar() -> None:
 
         # ── Cart summary ──────────────────────────────────────────────────
         cart_count = len(st.session_state.cart)
-        cat_count  = len(set(i.get("Category", "") for i in st.session_state.cart))
+        cat_count  = len(set(i.get("Category", "") for i in cart_items()))
         st.markdown(
             f"""
             <div style="background:linear-gradient(135deg,rgba(201,168,76,0.1),rgba(201,168,76,0.03));
@@ -57,13 +60,44 @@ def render_sidebar() -> None:
 
         # ── Data sync ─────────────────────────────────────────────────────
         st.markdown("### 🔄 Data Sync")
+        if is_snapshot_stale():
+            st.info("New images found on Cloudinary — click Refresh to update.")
         if st.button("Refresh Cloudinary & Excel", use_container_width=True):
-            st.cache_data.clear()
-            st.session_state.data_timestamp = time.time()
+            invalidate_data()
             st.session_state.gen_pdf_bytes  = None
             st.session_state.gen_excel_bytes= None
             st.toast("Data refreshed!", icon="🔄")
             st.rerun()
+        if st.button("Full Resync (ignore sync state)", use_container_width=True):
+            reset_sync_state()
+            invalidate_data()
+            st.session_state.gen_pdf_bytes  = None
+            st.session_state.gen_excel_bytes= None
+            st.toast("Full resync started!", icon="🔄")
+            st.rerun()
+        st.caption("Refresh only re-reads changed workbooks and new images.")
+
+        cloud = cloudinary_status()
+        # Offline mode is process-wide: mirror the shared flag so a switch
+        # made in another session shows up here too.
+        st.session_state.offline_mode_toggle = cloud["offline"]
+        st.toggle(
+            "Offline mode — all users (cached images & local DB only)",
+            key="offline_mode_toggle",
+            on_change=lambda: set_offline_mode(st.session_state.offline_mode_toggle),
+            help="Applies to every session on this server, not just yours.",
+        )
+        if not cloud["offline"] and cloud["breaker"] != "closed":
+            st.warning(
+                f"Cloudinary unreachable ({cloud['failures']} failed calls) — "
+                "using cached data until it recovers."
+            )
+        backup = backup_status()
+        last_ok = backup["last_success"]
+        st.caption(
+            f"Cloud backup: {len(backup['backlog'])} pending · last success "
+            f"{last_ok.strftime('%H:%M:%S') if last_ok else 'never since server start'}"
+        )
 
         st.markdown('<div class="gold-divider" style="margin:14px 0;"></div>',
                     unsafe_allow_html=True)
@@ -81,25 +115,25 @@ def render_sidebar() -> None:
             if st.button("Save Template", use_container_width=True,
                          key="sidebar_save_tpl_btn"):
                 if tpl_name.strip() and st.session_state.cart:
-                    save_template_to_disk(tpl_name.strip(), st.session_state.cart)
+                    save_template_to_disk(tpl_name.strip(), cart_entries())
                 elif not tpl_name.strip():
                     st.warning("Please enter a template name.")
                 else:
                     st.warning("Cart is empty — nothing to save.")
 
         # Load / delete existing templates
-        templates = load_saved_templates()
+        templates = list_saved_templates()
         if templates:
             with st.expander(f"Load / Delete Templates ({len(templates)})"):
-                for tpl_name, tpl_items in templates.items():
+                for tpl_name, tpl_count in templates.items():
                     col_load, col_del = st.columns([3, 1])
                     with col_load:
                         if st.button(
-                            f"📂 {tpl_name} ({len(tpl_items)} items)",
+                            f"📂 {tpl_name} ({tpl_count} items)",
                             key=f"load_tpl_{tpl_name}",
                             use_container_width=True,
                         ):
-                            st.session_state.cart          = list(tpl_items)
+                            set_cart(load_template(tpl_name))
                             st.session_state.gen_pdf_bytes = None
                             st.session_state.gen_excel_bytes = None
                             st.toast(f"Loaded '{tpl_name}'", icon="📂")
@@ -3,7 +3,6 @@ HEM Product Catalogue v3 — Tab 4: Add Product
 Custom product creation, management, and admin tools
 (override reset, hidden product restore).
 """
-import time
 import streamlit as st
 
 from config import CATALOGUE_PATHS
@@ -129,8 +128,7 @@ def render_add_product_tab(products_df) -> None:
                     )
 
                 st.success(
-                    f"✅ '{new_item_name}' added! (ID: {added['ProductID']})\n\n"
-                    f"Click **Refresh Cloudinary & Excel** in the sidebar to see it in the list."
+                    f"✅ '{new_item_name}' added! (ID: {added['ProductID']})"
                 )
 
     gold_divider()
@@ -168,8 +166,6 @@ def render_add_product_tab(products_df) -> None:
                     danger=True,
                 ):
                     delete_custom_item(item["ProductID"])
-                    st.session_state.data_timestamp = time.time()
-                    st.cache_data.clear()
                     st.toast(f"Deleted '{item['ItemName']}'", icon="🗑️")
                     st.rerun()
     else:
@@ -203,8 +199,6 @@ def render_add_product_tab(products_df) -> None:
             with c_reset:
                 if st.button("↩ Reset", key=f"reset_{pid}", use_container_width=True):
                     remove_product_override(pid)
-                    st.session_state.data_timestamp = time.time()
-                    st.cache_data.clear()
                     st.toast(f"Reset edits for {pid}", icon="↩️")
                     st.rerun()
     else:
@@ -235,8 +229,6 @@ def render_add_product_tab(products_df) -> None:
             with c_restore:
                 if st.button("↩ Restore", key=f"restore_{pid}", use_container_width=True):
                     unmark_product_deleted(pid)
-                    st.session_state.data_timestamp = time.time()
-                    st.cache_data.clear()
                     st.toast(f"Restored {pid}", icon="✅")
                     st.rerun()
     else:
@@ -11,13 +11,14 @@ import streamlit as st
 
 from config import BASE_DIR, LOGO_PATH, CASE_SIZE_PATH
 from cloudinary_client import get_image_as_base64_str
-from data_loader import load_data_cached
+from cart import cart_items
 from pdf_generator import generate_pdf_html, generate_excel_file, render_pdf
-from ui.components import section_header, gold_divider, empty_state
+from ui.components import section_header, gold_divider, empty_state, fragment
 
 logger = logging.getLogger(__name__)
 
 
+@fragment
 def render_export_tab(products_df: pd.DataFrame) -> None:
     """Render Tab 3 — Export Catalogue."""
     section_header("Export Catalogue", icon="📄")
@@ -34,7 +35,7 @@ def render_export_tab(products_df: pd.DataFrame) -> None:
         unsafe_allow_html=True,
     )
 
-    cart_categories = sorted({item["Category"] for item in st.session_state.cart})
+    cart_categories = sorted({item["Category"] for item in cart_items()})
 
     # Load case-size data (from local DB first, then GitHub Excel)
     full_case_df = pd.DataFrame()
@@ -153,7 +154,7 @@ def render_export_tab(products_df: pd.DataFrame) -> None:
 
 def _generate_files(products_df, client_name, selection_map):
     """Internal helper: build and store PDF + Excel in session state."""
-    cart_data   = st.session_state.cart
+    cart_data   = cart_items()
     schema_cols = [
         "Catalogue", "Category", "Subcategory", "ItemName",
         "Fragrance", "SKU Code", "ImageB64", "Packaging", "IsNew",
@@ -164,10 +165,9 @@ def _generate_files(products_df, client_name, selection_map):
             df[col] = ""
 
     # Sort products in the same order as original Excel catalogues
-    fresh_df     = load_data_cached(st.session_state.data_timestamp)
-    pid_to_order = {row["ProductID"]: i for i, row in fresh_df.iterrows()}
+    pid_to_order = {row["ProductID"]: i for i, row in products_df.iterrows()}
     if "ProductID" in df.columns:
-        df["_order"] = df["ProductID"].map(pid_to_order).fillna(len(fresh_df))
+        df["_order"] = df["ProductID"].map(pid_to_order).fillna(len(products_df))
         df = df.sort_values("_order").drop(columns=["_order"])
 
     df["SerialNo"] = range(1, len(df) + 1)
@@ -4,12 +4,14 @@ HEM Product Catalogue v3 — Tab 1: Filter Products
 Lets users browse, search, and select products to add to the cart.
 
 Layout:
-  • Global search bar (searches ItemName, Fragrance, SKU Code)
-  • Search mode  → shows matching products with all categories expanded
+  • Global search bar (ranked, typo-tolerant; see search_index.py)
+  • Search mode  → shows matching products as one list, best match first
   • Filter mode  → Catalogue selectbox → Category multiselect
                    → per-category Subcategory multiselect
   • Action buttons: ADD SELECTED · ADD FILTERED · Clear Filters
-  • Product list: thumbnail | name + badges | checkbox
+  • Product list: thumbnail | name + badges | checkbox, paginated per
+                  category so a rerun renders at most one page of rows
+                  per category
 
 NOTE: "Select All Categories" and "Deselect All" buttons are
       intentionally NOT present in this version.
@@ -17,15 +19,22 @@ NOTE: "Select All Categories" and "Deselect All" buttons are
 import pandas as pd
 import streamlit as st
 
-from config import NO_SELECTION_PLACEHOLDER
+from config import (
+    NO_SELECTION_PLACEHOLDER, PRODUCT_LIST_PAGE_SIZE, PRODUCT_LIST_PAGE_SIZES,
+)
 from database import load_products_db
 from data_loader import create_safe_id
-from cart import add_to_cart, add_selected_visible_to_cart, clear_filters_dropdown
-from ui.components import product_thumbnail_html, stats_bar, empty_state
+from cart import (
+    add_to_cart, add_selected_visible_to_cart, clear_filters_dropdown,
+    selection_key, toggle_selection, is_selected,
+)
+from search_index import get_search_index
+from ui.components import product_thumbnail_html, stats_bar, empty_state, fragment
 
 
 # ─────────────────────────────────────────────────────────────────────────────
-def _render_product_list(df: pd.DataFrame, expanded: bool = False) -> None:
+def _render_product_list(df: pd.DataFrame, expanded: bool = False,
+                         ranked: bool = False) -> None:
     """
     Render products grouped by Category inside collapsible expanders.
 
@@ -35,89 +44,157 @@ def _render_product_list(df: pd.DataFrame, expanded: bool = False) -> None:
     Args:
         df       – filtered product DataFrame to display
         expanded – whether to open all expanders by default (used in search mode)
+        ranked   – df is in relevance order (search mode): render it as one
+                   flat list instead of regrouping by Category/Subcategory
     """
     if df.empty:
         empty_state("🔍", "No products match your current filters or search.")
         return
 
     # Collect ProductIDs already in cart for badge display
-    cart_pids = {item.get("ProductID") for item in st.session_state.cart}
+    cart_pids = st.session_state.cart.keys()
 
     # Load overridden ProductIDs for 'EDITED' badge
     db            = load_products_db()
     overridden_pids = set(db.get("product_overrides", {}).keys())
 
     # Group by Category (preserving original order)
-    for category, cat_df in df.groupby("Category", sort=False):
-        count = len(cat_df)
+    groups = (
+        [("Search results", df)] if ranked
+        else df.groupby("Category", sort=False)
+    )
+    for category, cat_df in groups:
+        count   = len(cat_df)
+        cat_key = create_safe_id(category)
 
         with st.expander(f"**{category}**  ·  {count} products", expanded=expanded):
-
-            # Bulk-add button for this category only
-            _, btn_col = st.columns([5, 1])
+            page_df = _page_of(cat_df, cat_key)
+
+            # Bulk-add buttons: this page / this whole category
+            _, page_col, btn_col = st.columns([4, 1, 1])
+            if len(page_df) < count:
+                with page_col:
+                    if st.button(
+                        f"Add page ({len(page_df)})",
+                        key=f"add_page_{cat_key}",
+                        use_container_width=True,
+                    ):
+                        add_to_cart(page_df)
+                        st.rerun()
             with btn_col:
                 if st.button(
                     f"Add all {count}",
-                    key=f"add_all_{create_safe_id(category)}",
+                    key=f"add_all_{cat_key}",
                     use_container_width=True,
                 ):
                     add_to_cart(cat_df)
                     st.rerun()
 
-            # Iterate subcategories
-            for subcat, sub_df in cat_df.groupby("Subcategory", sort=False):
-                sub_str = str(subcat).strip()
-                # Only show subcategory header if it has a real value
-                if sub_str and sub_str.upper() != "N/A" and sub_str.lower() != "nan":
-                    st.markdown(
-                        f"<div class='subcat-header'>▸ {sub_str}"
-                        f" <span style='font-size:10px;opacity:0.6;'>({len(sub_df)})</span></div>",
-                        unsafe_allow_html=True,
-                    )
-
-                # Each product row
-                for _, row in sub_df.iterrows():
-                    pid         = row["ProductID"]
-                    cb_key      = f"checkbox_{pid}"
-                    in_cart     = pid in cart_pids
-                    is_new      = row.get("IsNew") == 1
-                    is_edited   = pid in overridden_pids
-                    is_custom   = str(pid).startswith("CUST_")
-
-                    # Build badge HTML
-                    badges = ""
-                    if is_new:
-                        badges += "<span class='badge-new'>NEW</span>"
-                    if is_edited:
-                        badges += "<span class='badge-modified'>EDITED</span>"
-                    if is_custom:
-                        badges += "<span class='badge-custom'>CUSTOM</span>"
-                    if in_cart:
-                        badges += "<span class='badge-in-cart'>IN CART</span>"
-
-                    # 3-column layout: thumb | name | checkbox
-                    c_thumb, c_name, c_check = st.columns([0.45, 7, 1])
-
-                    with c_thumb:
-                        st.markdown(
-                            product_thumbnail_html(row.get("ImageB64", ""), size=36),
-                            unsafe_allow_html=True,
-                        )
-                    with c_name:
-                        st.markdown(
-                            f"**{row['ItemName']}** {badges}",
-                            unsafe_allow_html=True,
-                        )
-                    with c_check:
-                        st.checkbox(
-                            "select",
-                            value=in_cart,
-                            key=cb_key,
-                            label_visibility="hidden",
-                        )
+            _render_rows(page_df, cart_pids, overridden_pids, grouped=not ranked)
+
+
+def _page_of(cat_df: pd.DataFrame, cat_key: str) -> pd.DataFrame:
+    """
+    Render the page-size / page controls for one category and return the
+    rows of the current page. Categories that fit in the smallest page
+    are returned whole, without controls.
+    """
+    sizes = sorted(set(PRODUCT_LIST_PAGE_SIZES + [PRODUCT_LIST_PAGE_SIZE]))
+    count = len(cat_df)
+    if count <= sizes[0]:
+        return cat_df
+
+    size_key = f"page_size_{cat_key}"
+    page_key = f"page_{cat_key}"
+    st.session_state.setdefault(size_key, PRODUCT_LIST_PAGE_SIZE)
+
+    c_info, c_size, c_page = st.columns([4, 1, 1])
+    with c_size:
+        page_size = st.selectbox("Per page", sizes, key=size_key)
+    pages = -(-count // page_size)
+    # Clamp a page left over from a larger result set or smaller page size
+    st.session_state[page_key] = min(st.session_state.get(page_key, 1), pages)
+    with c_page:
+        page = st.number_input(
+            f"Page (of {pages})", min_value=1, max_value=pages, step=1,
+            key=page_key,
+        )
+    start = (page - 1) * page_size
+    stop  = min(start + page_size, count)
+    with c_info:
+        st.caption(f"Showing {start + 1}–{stop} of {count}")
+    return cat_df.iloc[start:stop]
+
+
+def _render_rows(page_df: pd.DataFrame, cart_pids, overridden_pids,
+                 grouped: bool = True) -> None:
+    """Render one page of product rows, grouped by Subcategory unless
+    grouped is False (rows keep their order and show their Category)."""
+    sections = (
+        page_df.groupby("Subcategory", sort=False) if grouped
+        else [("", page_df)]
+    )
+    for subcat, sub_df in sections:
+        sub_str = str(subcat).strip()
+        # Only show subcategory header if it has a real value
+        if sub_str and sub_str.upper() != "N/A" and sub_str.lower() != "nan":
+            st.markdown(
+                f"<div class='subcat-header'>▸ {sub_str}"
+                f" <span style='font-size:10px;opacity:0.6;'>({len(sub_df)})</span></div>",
+                unsafe_allow_html=True,
+            )
+
+        # Each product row
+        for _, row in sub_df.iterrows():
+            pid         = row["ProductID"]
+            cb_key      = selection_key(pid)
+            in_cart     = pid in cart_pids
+            is_new      = row.get("IsNew") == 1
+            is_edited   = pid in overridden_pids
+            is_custom   = str(pid).startswith("CUST_")
+
+            # Build badge HTML
+            badges = ""
+            if is_new:
+                badges += "<span class='badge-new'>NEW</span>"
+            if is_edited:
+                badges += "<span class='badge-modified'>EDITED</span>"
+            if is_custom:
+                badges += "<span class='badge-custom'>CUSTOM</span>"
+            if in_cart:
+                badges += "<span class='badge-in-cart'>IN CART</span>"
+            if not grouped:
+                badges += (
+                    f" <span style='font-size:11px;opacity:0.6;'>"
+                    f"· {row.get('Category', '')}</span>"
+                )
+
+            # 3-column layout: thumb | name | checkbox
+            c_thumb, c_name, c_check = st.columns([0.45, 7, 1])
+
+            with c_thumb:
+                st.markdown(
+                    product_thumbnail_html(row.get("ImageB64", ""), size=36),
+                    unsafe_allow_html=True,
+                )
+            with c_name:
+                st.markdown(
+                    f"**{row['ItemName']}** {badges}",
+                    unsafe_allow_html=True,
+                )
+            with c_check:
+                st.checkbox(
+                    "select",
+                    value=is_selected(pid),
+                    key=cb_key,
+                    label_visibility="hidden",
+                    on_change=toggle_selection,
+                    args=(pid,),
+                )
 
 
 # ─────────────────────────────────────────────────────────────────────────────
+@fragment
 def render_filter_tab(products_df: pd.DataFrame) -> None:
     """
     Render Tab 1 — Filter Products.
@@ -134,7 +211,7 @@ def render_filter_tab(products_df: pd.DataFrame) -> None:
         st.session_state.item_search_query = st.session_state["_search_input_key"]
 
     search_term = st.text_input(
-        "🔍 Global Search — products, fragrances, SKU codes",
+        "🔍 Global Search — products, fragrances, SKU codes, categories",
         value=st.session_state.item_search_query,
         key="_search_input_key",
         on_change=_sync_search,
@@ -145,16 +222,13 @@ def render_filter_tab(products_df: pd.DataFrame) -> None:
     # SEARCH MODE
     # ═════════════════════════════════════════════════════════════════════
     if search_term:
-        working_df = products_df[
-            products_df["ItemName"].str.lower().str.contains(search_term, na=False) |
-            products_df["Fragrance"].str.lower().str.contains(search_term, na=False) |
-            products_df["SKU Code"].str.lower().str.contains(search_term, na=False)
-        ]
+        index = get_search_index(products_df, st.session_state.data_version)
+        working_df = products_df.iloc[index.ranked_positions(search_term)]
         stats_bar([
             ("Search results", f"{len(working_df)} products"),
             ("Cart", f"{len(st.session_state.cart)} items"),
         ])
-        _render_product_list(working_df, expanded=True)
+        _render_product_list(working_df, expanded=True, ranked=True)
         return
 
     # ═════════════════════════════════════════════════════════════════════
@@ -2,24 +2,28 @@
 HEM Product Catalogue v3 — Tab 2: Review & Edit Cart
 Inline editing, change detection, per-row removal, and cart clear.
 """
-import time
 import pandas as pd
 import streamlit as st
 
-from database import load_products_db, save_product_override, save_cart_to_db
-from cart import remove_from_cart, clear_cart
-from ui.components import section_header, stats_bar, confirm_action, empty_state, gold_divider
+from database import load_products_db, save_product_overrides_bulk
+from data_loader import patch_loaded_frame
+from cart import remove_from_cart, clear_cart, cart_items, apply_item_edits
+from ui.components import (
+    section_header, stats_bar, confirm_action, empty_state, gold_divider, fragment,
+)
 
 
+@fragment
 def render_review_tab() -> None:
     """Render Tab 2 — Review & Edit Cart."""
     section_header("Review & Edit Cart", icon="✏️")
 
-    if not st.session_state.cart:
+    items = cart_items()
+    if not items:
         empty_state("🛒", "Your cart is empty. Go to <strong>Filter Products</strong> to add items.")
         return
 
-    cart_df = pd.DataFrame(st.session_state.cart)
+    cart_df = pd.DataFrame(items)
 
     # ── In-cart search ────────────────────────────────────────────────────
     search = st.text_input(
@@ -106,14 +110,9 @@ def render_review_tab() -> None:
         btn_lbl   = f"💾 Save {len(changes)} Edit(s)" if changes else "No Changes"
         if st.button(btn_lbl, disabled=not changes,
                      use_container_width=True, type="primary"):
-            for pid, delta in changes.items():
-                save_product_override(pid, delta)
-                for item in st.session_state.cart:
-                    if item.get("ProductID") == pid:
-                        item.update(delta)
-            save_cart_to_db(st.session_state.cart)
-            st.session_state.data_timestamp = time.time()
-            st.cache_data.clear()
+            save_product_overrides_bulk(changes)
+            apply_item_edits(changes)
+            patch_loaded_frame(changes, st.session_state.data_version)
             st.toast(f"Saved {len(changes)} edit(s)!", icon="✅")
             st.rerun()
 